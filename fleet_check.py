@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the config.toml files of a whole chain of stores before they are
+pushed out. Every config is validated and compiled in parallel, every
+announcement file it refers to is checked to exist and decode (with
+ffmpeg, when installed), and a year of each store's effective schedule
+is expanded, so a fleet-wide change can be reviewed as a plain diff.
+
+Store configs are either STORES/<store>.toml or STORES/<store>/config.toml.
+Announcement files are looked up like on the Pi, relative to the store's
+working directory: STORES/<store>/ for the second layout, otherwise the
+--media folder (MEDIA/<store>/ if it exists, else MEDIA itself).
+
+Kontrollib kõigi kaupluste config.toml faile enne nende laialisaatmist.
+
+Usage / Kasutamine:
+    python3 fleet_check.py stores/ --media media/ --year 2027 --output build/
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import toml
+
+import play_audio
+
+# Keys the runtime reads without a default / Võtmed, millel vaikeväärtust pole
+REQUIRED_KEYS = ('default_open_time', 'default_close_time', 'time_before_opening', 'time_after_closing',
+                 'weekly_schedule', 'config_check_interval')
+# The runtime also takes "9:00", which is only warned about / Käitusaeg võtab ka "9:00", selle kohta on vaid hoiatus
+TIME_PATTERN = re.compile(r"\d{2}:\d{2}")
+TIME_PATTERN_SECONDS = re.compile(r"\d{2}:\d{2}(:\d{2})?")
+
+def find_stores(stores_dir, media_dir=None):
+    # Returns {store name: (config path, announcement folder)}
+    stores = {}
+    for entry in sorted(os.scandir(stores_dir), key=lambda entry: entry.name):
+        if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "config.toml")):
+            stores[entry.name] = (os.path.join(entry.path, "config.toml"), entry.path)
+        elif entry.is_file() and entry.name.endswith(".toml"):
+            name = entry.name[:-len(".toml")]
+            media = media_dir or stores_dir
+            if media_dir and os.path.isdir(os.path.join(media_dir, name)):
+                media = os.path.join(media_dir, name)
+            stores[name] = (entry.path, media)
+    return stores
+
+def check_time(errors, warnings, where, value, seconds=False):
+    expected = '"HH:MM" or "HH:MM:SS"' if seconds else '"HH:MM"'
+    try:
+        if seconds:
+            play_audio.parse_seconds(value)
+        else:
+            play_audio.parse_minutes(value)
+    except (ValueError, TypeError, AttributeError):
+        errors.append(f"{where}: {value!r} is not a time of day, expected {expected}")
+        return
+    if not (TIME_PATTERN_SECONDS if seconds else TIME_PATTERN).fullmatch(value):
+        warnings.append(f"{where}: {value!r} works, but is not written as {expected}")
+
+def check_table(errors, where, value):
+    # True when value is a table; otherwise records an error
+    if isinstance(value, dict):
+        return True
+    errors.append(f"{where}: expected a table, not {value!r}")
+    return False
+
+def check_announcements(errors, warnings, where, announcements, files):
+    if not isinstance(announcements, dict):
+        errors.append(f"{where}: expected a table of \"time\" = \"file\"")
+        return
+    for time_str, announcement_file in announcements.items():
+        check_time(errors, warnings, f"{where}.\"{time_str}\"", time_str, seconds=True)
+        if isinstance(announcement_file, str) and announcement_file:
+            files.add(announcement_file)
+        else:
+            errors.append(f"{where}.\"{time_str}\": {announcement_file!r} is not a file name")
+
+def check_config(config):
+    """
+    Checks the parts of a config that the runtime would only trip over
+    later (a bad time raises inside main(), a missing key on reload).
+    Returns (errors, warnings, announcement files).
+    """
+    errors, warnings, files = [], [], set()
+    for key in REQUIRED_KEYS:
+        if key not in config:
+            errors.append(f"{key}: missing")
+    for key in ('default_open_time', 'default_close_time'):
+        if key in config:
+            check_time(errors, warnings, key, config[key])
+    for key in ('time_before_opening', 'time_after_closing', 'config_check_interval'):
+        if key in config and (not isinstance(config[key], int) or config[key] < 0):
+            errors.append(f"{key}: {config[key]!r} is not a whole number of minutes")
+
+    # Every table is checked to be one before it is read / Iga tabelit kontrollitakse enne lugemist
+    weekly_schedule = config.get('weekly_schedule', {})
+    for day_name, day in (weekly_schedule.items() if check_table(errors, "weekly_schedule", weekly_schedule) else ()):
+        if day_name not in play_audio.DAY_NAMES:
+            warnings.append(f"weekly_schedule.{day_name}: not a day name, ignored")
+        if not check_table(errors, f"weekly_schedule.{day_name}", day):
+            continue
+        for key in ('open_time', 'close_time'):
+            if key in day:
+                check_time(errors, warnings, f"weekly_schedule.{day_name}.{key}", day[key])
+
+    check_announcements(errors, warnings, "default_announcements", config.get('default_announcements', {}), files)
+    announcements_by_day = config.get('announcements', {})
+    for day_name, announcements in (announcements_by_day.items() if check_table(errors, "announcements", announcements_by_day) else ()):
+        if day_name not in play_audio.DAY_NAMES:
+            warnings.append(f"announcements.{day_name}: not a day name, ignored")
+            continue
+        check_announcements(errors, warnings, f"announcements.{day_name}", announcements, files)
+
+    date_exceptions = config.get('date_exceptions', {})
+    for date_str, exception in (date_exceptions.items() if check_table(errors, "date_exceptions", date_exceptions) else ()):
+        where = f"date_exceptions.\"{date_str}\""
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            errors.append(f"{where}: not a date, expected \"YYYY-MM-DD\"")
+        if not check_table(errors, where, exception):
+            continue
+        if not isinstance(exception.get('closed', False), bool):
+            errors.append(f"{where}.closed: {exception['closed']!r} is not true or false")
+        for key in ('open_time', 'close_time'):
+            if key in exception:
+                check_time(errors, warnings, f"{where}.{key}", exception[key])
+        if 'announcements' in exception:
+            check_announcements(errors, warnings, f"{where}.announcements", exception['announcements'], files)
+
+    folder_weights = config.get('folder_weights', {})
+    for folder, weight in (folder_weights.items() if check_table(errors, "folder_weights", folder_weights) else ()):
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+            errors.append(f"folder_weights.\"{folder}\": {weight!r} is not a weight of 0 or more")
+
+    dayparts = config.get('dayparts', {})
+    for name, daypart in (dayparts.items() if check_table(errors, "dayparts", dayparts) else ()):
+        if not check_table(errors, f"dayparts.{name}", daypart):
+            continue
+        for key in ('start', 'end'):
+            if key not in daypart:
+                errors.append(f"dayparts.{name}.{key}: missing")
+            else:
+                check_time(errors, warnings, f"dayparts.{name}.{key}", daypart[key])
+        folders = daypart.get('folders', [])
+        if not isinstance(folders, list) or not all(isinstance(folder, str) for folder in folders):
+            errors.append(f"dayparts.{name}.folders: expected a list of folder names")
+
+    zones = config.get('zones', {})
+    if not check_table(errors, "zones", zones) or not all(
+            check_table(errors, f"zones.{name}", zone) for name, zone in zones.items()):
+        return errors, warnings, files
+    for name, zone in play_audio.get_zone_configs(config).items():
+        volume = zone.get('volume', 100)
+        if not isinstance(volume, int) or not 0 <= volume <= 100:
+            errors.append(f"zones.{name}.volume: {volume!r} is not between 0 and 100")
+        routing = zone.get('play_announcements', True)
+        if isinstance(routing, list):
+            for announcement_file in routing:
+                if announcement_file not in files:
+                    warnings.append(f"zones.{name}.play_announcements: {announcement_file!r} is never scheduled")
+        elif not isinstance(routing, bool):
+            errors.append(f"zones.{name}.play_announcements: expected true, false or a list of file names")
+    return errors, warnings, files
+
+def expand_year(schedule, year):
+    # One line per date: the music window and the announcements in effect
+    lines = []
+    summary = {'open_days': 0, 'closed_days': 0, 'music_hours': 0.0, 'announcements': 0}
+    day = date(year, 1, 1)
+    while day.year == year:
+        window = schedule.window_for(day)
+        announcements = schedule.announcements_for(day)
+        if window:
+            summary['open_days'] += 1
+            summary['music_hours'] += (window[1] - window[0]).total_seconds() / 3600
+            hours = f"{window[0]:%H:%M}-{window[1]:%H:%M}" + (" (+1 day)" if window[1].date() > day else "")
+        else:
+            summary['closed_days'] += 1
+            hours = "closed"
+        summary['announcements'] += len(announcements)
+        played = ", ".join(f"{play_audio.format_slot(slot)} {f}" for slot, f in announcements)
+        lines.append(f"{day} {day:%a} {hours}" + (f" | {played}" if played else ""))
+        day += timedelta(days=1)
+    summary['music_hours'] = round(summary['music_hours'], 1)
+    return lines, summary
+
+def new_result(name, config_path):
+    return {'store': name, 'config': config_path, 'errors': [], 'warnings': [], 'files': {}, 'summary': None}
+
+def check_store(name, config_path, media_dir, year, output_dir=None):
+    # Runs in a worker process / Töötab eraldi protsessis
+    result = new_result(name, config_path)
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = toml.load(f)
+    except (OSError, toml.TomlDecodeError) as e:
+        result['errors'].append(f"cannot load: {e}")
+        return result
+    try:
+        errors, warnings, files = check_config(config)
+    except Exception as e:  # a shape of config the checks above do not expect
+        result['errors'].append(f"cannot check: {e!r}")
+        return result
+    result['errors'] += errors
+    result['warnings'] += warnings
+    result['files'] = {announcement_file: os.path.join(media_dir, announcement_file) for announcement_file in sorted(files)}
+    if errors:
+        return result
+
+    # The same compile and cache file the runtime uses, keyed by the hash of the exact config bytes
+    try:
+        if output_dir:
+            os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+            schedule = play_audio.CompiledSchedule.load_or_compile(
+                config, play_audio.get_file_hash(config_path), cache_path=os.path.join(output_dir, name, "schedule_cache.json"))
+        else:
+            schedule = play_audio.CompiledSchedule.compile(config)
+    except Exception as e:
+        result['errors'].append(f"does not compile: {e!r}")
+        return result
+    try:
+        lines, result['summary'] = expand_year(schedule, year)
+    except Exception as e:
+        result['errors'].append(f"cannot expand {year}: {e!r}")
+        return result
+    if output_dir:
+        with open(os.path.join(output_dir, name, f"schedule-{year}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return result
+
+def check_media(path):
+    # Runs in a worker process. Returns None when the file is fine, otherwise the problem.
+    if not os.path.isfile(path):
+        return "not found"
+    if not shutil.which("ffmpeg"):
+        return None
+    try:
+        result = subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-v", "error", "-i", path, "-f", "null", "-"],
+                                capture_output=True, text=True, timeout=300)
+    except subprocess.TimeoutExpired:
+        return "decoding timed out"
+    if result.returncode != 0:
+        return "does not decode: " + (result.stderr.strip().splitlines() or ["ffmpeg failed"])[-1]
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate, compile and expand the config.toml files of many stores.")
+    parser.add_argument("stores", help="folder with <store>.toml files or <store>/config.toml folders")
+    parser.add_argument("--media", help="announcement folder for <store>.toml configs (MEDIA/<store>/ or MEDIA)")
+    parser.add_argument("--year", type=int, default=datetime.now().year, help="year to expand (default: this year)")
+    parser.add_argument("--output", help="write <store>/schedule_cache.json and <store>/schedule-<year>.txt here")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parallel processes (default: all CPUs)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    stores = find_stores(args.stores, args.media)
+    if not stores:
+        sys.exit(f"No store configs found in {args.stores}")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(check_store, name, config_path, media_dir, args.year, args.output)
+                   for name, (config_path, media_dir) in stores.items()]
+        results = []
+        for (name, (config_path, _)), future in zip(stores.items(), futures):
+            try:
+                results.append(future.result())
+            except Exception as e:  # the worker itself failed, e.g. it was killed
+                result = new_result(name, config_path)
+                result['errors'].append(f"check failed: {e!r}")
+                results.append(result)
+        # Stores share most announcements; each file is decoded once
+        paths = sorted({path for result in results for path in result['files'].values()})
+        problems = dict(zip(paths, pool.map(check_media, paths, chunksize=8)))
+    for result in results:
+        for announcement_file, path in result.pop('files').items():
+            if problems[path]:
+                result['errors'].append(f"announcement {announcement_file}: {problems[path]} ({path})")
+
+    failed = [result for result in results if result['errors']]
+    if args.json:
+        print(json.dumps({'year': args.year, 'stores': results, 'failed': len(failed)}, indent=2))
+    else:
+        if not shutil.which("ffmpeg"):
+            print("ffmpeg not found: announcement files were only checked to exist.")
+        for result in results:
+            summary = result['summary']
+            status = "FAIL" if result['errors'] else "ok"
+            detail = (f": {summary['open_days']} open days, {summary['music_hours']} h of music, "
+                      f"{summary['announcements']} announcements in {args.year}") if summary else ""
+            print(f"{status:4} {result['store']}{detail}")
+            for error in result['errors']:
+                print(f"     error: {error}")
+            for warning in result['warnings']:
+                print(f"     warning: {warning}")
+        print(f"{len(results) - len(failed)} of {len(results)} stores ok.")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,70 @@
 import toml
 import time
 from datetime import datetime, timedelta
-import vlc
 import os
 import logging
 import hashlib
-import subprocess
 import re
 import resource
+import http.server
+import bisect
+import json
+import ctypes
+import ctypes.util
+import select
+import struct
+import sqlite3
+import heapq
+import itertools
+import threading
+import random
+from array import array
+import queue
+import logging.handlers
+import gzip
+import shutil
+import atexit
+import subprocess
+import multiprocessing
+import asyncio
+import signal
+import faulthandler
+import cProfile
+import pstats
+import tracemalloc
+import traceback
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, OrderedDict
 from typing import Union
 
 # Define working directories and file paths / Määrake töökaustad ja failiteed
 WORKING_DIR = os.path.expanduser("~/Radio")
 CONFIG_PATH = os.path.join(WORKING_DIR, "config.toml")
 LOG_DIR = os.path.join(WORKING_DIR, "logs")
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
 # LOG_FILE global variable: Its role changes. It will be updated by setup_logging.
 # Initialize it here for clarity, though setup_logging will define its operational value.
 LOG_FILE = os.path.join(LOG_DIR, datetime.now().strftime("%m%d%Y") + ".log")
+LIBRARY_DB = os.path.join(WORKING_DIR, "library.db")
+SCHEDULE_CACHE = os.path.join(WORKING_DIR, "schedule_cache.json")
+METRICS_FILE = os.path.join(WORKING_DIR, "metrics.prom")
+AUDIO_DEVICE_CACHE = os.path.join(WORKING_DIR, "audio_device.json")
+STATE_FILE = os.path.join(WORKING_DIR, "state.json")
+CONTROL_SOCKET = os.path.join(WORKING_DIR, "control.sock")
+STACK_DUMP_FILE = "stack_dumps.txt"  # in LOG_DIR
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.oga', '.opus', '.m4a', '.aac', '.wma')
+# Formats that are costly to decode on a small Pi; these are transcoded to WAV while the music is off
+TRANSCODE_FORMATS = ('flac', 'ogg', 'oga', 'opus', 'm4a', 'aac', 'wma')
+DAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+SECONDS_PER_DAY = 24 * 60 * 60
 RESTART_INTERVAL = 24 * 60 * 60  # 24 hours in seconds / 24 tundi sekundites
+# Restart delays after a crash double from MIN to MAX; a run longer than STABLE_RUN resets them
+MIN_RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+STABLE_RUN = 10 * 60
 
 # Configure logging / Seadistage logimine
 # Get the root logger once at the module level / Hangi juurlogija üks kord mooduli tasemel
@@ -30,70 +75,515 @@ logger.setLevel(logging.INFO)
 # Define a common log formatter / Määra ühine logivormindaja
 log_formatter = logging.Formatter('%(asctime)s %(levelname)s:%(message)s')
 
-def setup_logging():
-    """
-    Configures file logging. Removes old file handlers and adds a new one
-    for the current day's log file. Ensures logs are written to a new file
-    when the date changes.
+# Longest log line kept, in characters; longer lines are cut / Pikim logirida
+LOG_MAX_LINE = 2000
+LOG_NAME_PATTERN = re.compile(r"^(\d{8})\.log(\.gz)?$")
 
-    Seadistab failipõhise logimise. Eemaldab vanad failihaldurid ja lisab uue
-    praeguse päeva logifaili jaoks. Tagab, et logid kirjutatakse uude faili,
-    kui kuupäev muutub.
+class LogWriter(threading.Thread):
     """
-    global LOG_FILE # To update the global LOG_FILE variable's value / Globaalse LOG_FILE muutuja väärtuse uuendamiseks
+    Writes log records to the daily log file on its own thread, so a slow or
+    worn SD card never delays a track change or an announcement. Records
+    arrive through a QueueHandler on the root logger. Lines are written in
+    batches (warnings and errors at once), a new file is started when the
+    date changes, and finished days are gzipped and pruned to the retention
+    budget.
+
+    Kirjutab logid eraldi lõimes päevalogifaili, pakib lõpetatud päevad
+    gzip'iga kokku ja kustutab vanad logid.
+    """
+    BATCH_LINES = 50
+    FLUSH_INTERVAL = 2.0  # seconds
+
+    def __init__(self, log_dir, retention_days=30, retention_mb=100):
+        super().__init__(name="log-writer", daemon=True)
+        self.log_dir = log_dir
+        self.retention_days = retention_days
+        self.retention_mb = retention_mb
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.file_day = None
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def run(self):
+        while True:
+            # Sleep until a record arrives; the flush timeout only runs while lines are waiting
+            try:
+                item = self.queue.get(timeout=self.FLUSH_INTERVAL if self.pending else None)
+            except queue.Empty:
+                self.flush()
+                continue
+            if item is None:
+                break
+            if item == "housekeeping":
+                self.housekeeping()
+            else:
+                self.write(item)
+        self.flush()
+        if self.file:
+            self.file.close()
+
+    def write(self, record):
+        day = datetime.fromtimestamp(record.created).date()
+        if day != self.file_day:
+            self.rollover(day)
+        # Tracebacks span several lines; each one is capped separately
+        lines = log_formatter.format(record).split("\n")
+        self.pending.extend(line if len(line) <= LOG_MAX_LINE else
+                            f"{line[:LOG_MAX_LINE]}... [{len(line) - LOG_MAX_LINE} characters cut]"
+                            for line in lines)
+        if (record.levelno >= logging.WARNING or len(self.pending) >= self.BATCH_LINES
+                or time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending or not self.file:
+            return
+        try:
+            self.file.write("\n".join(self.pending) + "\n")
+            self.file.flush()
+        except OSError as e:
+            # Lines are dropped rather than piling up in memory while the card is failing
+            print(f"Could not write {len(self.pending)} log lines: {e}")
+        self.pending = []
+
+    def rollover(self, day):
+        global LOG_FILE # To update the global LOG_FILE variable's value / Globaalse LOG_FILE muutuja väärtuse uuendamiseks
+        self.flush()
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.file_day = day
+        path = os.path.join(self.log_dir, day.strftime("%m%d%Y") + ".log")
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.file = open(path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"Could not open log file {path}: {e}")
+            return
+        LOG_FILE = path
+        self.housekeeping()
+
+    def set_retention(self, retention_days, retention_mb):
+        self.retention_days = retention_days
+        self.retention_mb = retention_mb
+        self.queue.put("housekeeping")
+
+    def housekeeping(self):
+        # Compresses finished daily logs and deletes the oldest ones past the budget
+        logs = []
+        for name in os.listdir(self.log_dir) if os.path.isdir(self.log_dir) else ():
+            match = LOG_NAME_PATTERN.match(name)
+            if not match:
+                continue
+            try:
+                day = datetime.strptime(match.group(1), "%m%d%Y").date()
+            except ValueError:
+                continue
+            path = os.path.join(self.log_dir, name)
+            if day == self.file_day:
+                logs.append((day, path))
+                continue
+            if not match.group(2):
+                path = self.compress(path)
+            if path:
+                logs.append((day, path))
+
+        logs.sort()
+        sizes = {path: os.path.getsize(path) for _, path in logs if os.path.exists(path)}
+        total = sum(sizes.values())
+        oldest_kept = self.file_day - timedelta(days=self.retention_days) if self.file_day else None
+        for day, path in logs:
+            if day == self.file_day or path not in sizes:
+                continue
+            if (oldest_kept and day >= oldest_kept) and total <= self.retention_mb * 1024 * 1024:
+                break
+            try:
+                os.remove(path)
+                total -= sizes[path]
+                logging.info(f"Deleted old log file {path}")
+            except OSError as e:
+                print(f"Could not delete old log file {path}: {e}")
+
+    def compress(self, path):
+        compressed = path + ".gz"
+        try:
+            with open(path, "rb") as source, gzip.open(compressed + ".tmp", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.replace(compressed + ".tmp", compressed)
+            os.remove(path)
+            return compressed
+        except OSError as e:
+            print(f"Could not compress log file {path}: {e}")
+            return None
 
-    current_log_filename = os.path.join(LOG_DIR, datetime.now().strftime("%m%d%Y") + ".log")
+    def close(self):
+        self.queue.put(None)
+        self.join(timeout=5)
 
-    # Remove any existing FileHandlers from the root logger / Eemalda kõik olemasolevad FileHandlerid juurlogijast
-    # Iterate over a copy of logger.handlers list to allow modification / Itereeri logger.handlers nimekirja koopia üle, et võimaldada muutmist
-    for handler in logger.handlers[:]: 
-        if isinstance(handler, logging.FileHandler):
-            # Using print for this critical step, as logging might be in transition. / Kasuta printi selle kriitilise sammu jaoks, kuna logimine võib olla ülemineku faasis.
-            print(f"Attempting to close and remove old log handler for: {handler.baseFilename}")
-            handler.close()
-            logger.removeHandler(handler)
-            print(f"Successfully closed and removed old log handler for: {handler.baseFilename}")
+log_writer = None
 
-    # Add the new FileHandler for the current day / Lisa uus FileHandler praeguse päeva jaoks
-    file_handler = logging.FileHandler(current_log_filename)
-    file_handler.setFormatter(log_formatter)
-    logger.addHandler(file_handler)
-    
-    # Update the global LOG_FILE variable to the new path / Uuenda globaalne LOG_FILE muutuja uue failiteega
-    LOG_FILE = current_log_filename
-    
-    # Log confirmation to the new log file. This message is crucial for confirming the switch. / Logi kinnitus uude logifaili. See sõnum on lülituse kinnitamiseks ülioluline.
-    logging.info(f"Logging setup/reconfigured. Now logging to: {LOG_FILE}")
+def setup_logging():
+    """
+    Starts the background log writer and routes the root logger to it.
+    The writer switches to a new daily log file by itself when the date
+    changes, so this only has to be called once.
 
+    Käivitab taustal töötava logikirjutaja ja suunab juurlogija sellele.
+    Kirjutaja vahetab kuupäeva muutumisel ise päevalogifaili.
+    """
+    global log_writer
+    if log_writer is not None:
+        return
+    log_writer = LogWriter(LOG_DIR)
+    log_writer.start()
+    # No formatter on the QueueHandler: the writer formats with log_formatter
+    logger.addHandler(logging.handlers.QueueHandler(log_writer.queue))
+    atexit.register(log_writer.close)
+    logging.info(f"Logging setup/reconfigured. Now logging to: {LOG_DIR}")
+
+# Function to apply the log retention settings / Funktsioon logide säilitamise seadete rakendamiseks
+def configure_log_retention(config):
+    if log_writer is not None:
+        log_writer.set_retention(config.get('log_retention_days', 30), config.get('log_retention_mb', 100))
+
+# Function to read the current RSS / Funktsioon praeguse RSS-i lugemiseks
+def get_current_rss_kb():
+    # /proc/self/statm holds the current RSS in pages; ru_maxrss is only the peak
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
-# Initial call to set up logging when the script starts. / Esmane logimise seadistamise kutse skripti käivitamisel.
-# This replaces the old setup_logging() call at the module level.
-setup_logging()
+# Function to read the process thread count / Funktsioon protsessi lõimede arvu lugemiseks
+def get_thread_count():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return threading.active_count()
 
 def log_memory_usage(enabled=False):
     if not enabled:
         return
     try:
-        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-        # Linux returns ru_maxrss in kilobytes.
+        usage = get_current_rss_kb()
         logging.info(f"Memory Usage (RSS): {usage} KB")
     except Exception as e:
         logging.error(f"Failed to log memory usage: {e}")
 
+class Diagnostics:
+    """
+    On-demand diagnostics for stutter and hangs reported from a store.
+    SIGUSR1 writes a snapshot bundle: all thread stacks, the station and
+    VLC player state, and memory use. SIGUSR2 (or diagnostics = true in
+    config.toml) starts a capture: the main loop runs under cProfile and
+    tracemalloc for diagnostics_seconds, then a bundle with the profile
+    and the top memory growth is written. Bundles go to
+    LOG_DIR/diagnostics-<timestamp>/.
+
+    Nothing is traced until a capture starts, so it costs nothing while
+    off. faulthandler also writes the stacks to STACK_DUMP_FILE on
+    SIGUSR1, which works even when the main loop itself is stuck.
+    """
+    # Bundles kept in LOG_DIR; older ones are deleted / Alles hoitavate kogumite arv
+    KEEP_BUNDLES = 10
+    TOP_ALLOCATIONS = 25
+    TOP_FUNCTIONS = 40
+
+    def __init__(self, station, log_dir=LOG_DIR):
+        self.station = station
+        self.log_dir = log_dir
+        self.profiler = None
+        self.baseline = None  # tracemalloc snapshot at the start of the capture
+        self.capture_started = None
+        self.stack_dump_file = None
+
+    def install(self, loop):
+        # Signals are handled on the asyncio loop, between two events
+        loop.add_signal_handler(signal.SIGUSR1, self.snapshot)
+        loop.add_signal_handler(signal.SIGUSR2, self.toggle_capture)
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.stack_dump_file = open(os.path.join(self.log_dir, STACK_DUMP_FILE), "a")
+            # Chained after the loop's handler, so SIGUSR1 still reaches snapshot()
+            faulthandler.register(signal.SIGUSR1, file=self.stack_dump_file, all_threads=True, chain=True)
+        except OSError as e:
+            logging.warning(f"Could not open stack dump file: {e}")
+
+    def uninstall(self, loop):
+        loop.remove_signal_handler(signal.SIGUSR1)
+        loop.remove_signal_handler(signal.SIGUSR2)
+        if self.stack_dump_file:
+            faulthandler.unregister(signal.SIGUSR1)
+            self.stack_dump_file.close()
+            self.stack_dump_file = None
+        self.stop_capture(write=False)
+
+    @property
+    def capturing(self):
+        return self.profiler is not None
+
+    def toggle_capture(self):
+        if self.capturing:
+            self.stop_capture()
+        else:
+            self.start_capture()
+
+    def start_capture(self):
+        if self.capturing:
+            return
+        seconds = self.station.config.get('diagnostics_seconds', 60)
+        logging.info(f"Diagnostics capture started for {seconds} s.")
+        tracemalloc.start()
+        self.baseline = tracemalloc.take_snapshot()
+        self.capture_started = self.station.clock.now()
+        # The profiler follows the thread it is enabled on: the main loop
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        self.station.scheduler.schedule(self.capture_started + timedelta(seconds=seconds), "diagnostics_stop")
+
+    def stop_capture(self, write=True):
+        if not self.capturing:
+            return
+        self.profiler.disable()
+        self.station.scheduler.cancel("diagnostics_stop")
+        files = {}
+        if write:
+            seconds = (self.station.clock.now() - self.capture_started).total_seconds()
+            # Memory first, before building the report allocates anything
+            growth = tracemalloc.take_snapshot().compare_to(self.baseline, "lineno")[:self.TOP_ALLOCATIONS]
+            files["tracemalloc.txt"] = (f"Top {len(growth)} allocation sites by growth over {seconds:.1f} s\n\n"
+                                        + "\n".join(str(stat) for stat in growth) + "\n")
+            stream = io.StringIO()
+            stream.write(f"Main loop profile over {seconds:.1f} s\n\n")
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(self.TOP_FUNCTIONS)
+            files["profile.txt"] = stream.getvalue()
+        tracemalloc.stop()
+        self.profiler = self.baseline = self.capture_started = None
+        if write:
+            self.write_bundle(files)
+
+    def snapshot(self):
+        self.write_bundle({})
+
+    def thread_stacks(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        lines = []
+        for ident, frame in sys._current_frames().items():
+            lines.append(f"Thread {names.get(ident, '?')} ({ident}):")
+            lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+            lines.append("")
+        return "\n".join(lines)
+
+    def write_bundle(self, files):
+        files["threads.txt"] = self.thread_stacks()
+        state = self.station.command_status({}, self.station.zones)
+        state['vlc'] = {name: zone.radio_player.diagnostics() for name, zone in self.station.zones.items()}
+        state['threads'] = get_thread_count()
+        state['capture_running'] = self.capturing
+        files["status.json"] = json.dumps(state, indent=2, default=str)
+        path = os.path.join(self.log_dir, "diagnostics-" + datetime.now().strftime("%Y%m%d-%H%M%S"))
+        try:
+            os.makedirs(path, exist_ok=True)
+            for name, content in files.items():
+                with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+                    f.write(content)
+        except OSError as e:
+            logging.error(f"Could not write diagnostics bundle {path}: {e}")
+            return
+        logging.info(f"Diagnostics written to {path}")
+        self.prune()
+
+    def prune(self):
+        bundles = sorted(name for name in os.listdir(self.log_dir) if name.startswith("diagnostics-"))
+        for name in bundles[:-self.KEEP_BUNDLES]:
+            shutil.rmtree(os.path.join(self.log_dir, name), ignore_errors=True)
+
+class Metrics:
+    """
+    In-process metrics for the player. Timings go into fixed-size ring
+    buffers and counters are plain integers, so recording is a deque append
+    under a lock and safe from VLC's event thread. render() works on a copy
+    taken under the same lock and produces the Prometheus text
+    format, which is written to METRICS_FILE for node_exporter's textfile
+    collector and served over HTTP on localhost when metrics_http_port is set.
+    """
+    SAMPLES = 256
+    QUANTILES = (0.5, 0.9, 0.99)
+    SUMMARIES = {
+        'wakeup_latency_seconds': "Delay between a timed event being due and the main loop handling it.",
+        'track_gap_seconds': "Silence between the end of a track and the start of the next one.",
+        'announcement_lateness_seconds': "Announcement start time minus its scheduled time.",
+        'config_reload_seconds': "Time taken to apply a changed config file.",
+    }
+    COUNTERS = {
+        'wakeups_total': "Main loop wakeups.",
+        'tracks_played_total': "Background tracks started.",
+        'announcements_played_total': "Announcements started.",
+        'announcements_dropped_total': "Announcements dropped for being later than announcement_catch_up.",
+        'vlc_errors_total': "VLC error states, by player.",
+    }
+
+    def __init__(self):
+        self.started = time.time()
+        self.samples = {name: deque(maxlen=self.SAMPLES) for name in self.SUMMARIES}
+        self.sums = dict.fromkeys(self.SUMMARIES, 0.0)
+        self.counts = dict.fromkeys(self.SUMMARIES, 0)
+        self.counters = {name: {} for name in self.COUNTERS}
+        # Recording happens on VLC's event threads, reading on the loop and HTTP threads
+        self._lock = threading.Lock()
+        self.http_server = None
+
+    def observe(self, name, value):
+        with self._lock:
+            self.samples[name].append(value)
+            self.sums[name] += value
+            self.counts[name] += 1
+
+    def increment(self, name, label=None):
+        with self._lock:
+            counter = self.counters[name]
+            counter[label] = counter.get(label, 0) + 1
+
+    def snapshot(self):
+        # Consistent copies of (samples, sums, counts, counters)
+        with self._lock:
+            return ({name: list(values) for name, values in self.samples.items()}, dict(self.sums), dict(self.counts),
+                    {name: dict(counter) for name, counter in self.counters.items()})
+
+    def totals(self):
+        # Counter values summed over their labels, for the control API's status
+        counters = self.snapshot()[3]
+        return {name: sum(counter.values()) for name, counter in counters.items()}
+
+    def render(self):
+        samples, sums, counts, counters = self.snapshot()
+        lines = []
+        for name, help_text in self.SUMMARIES.items():
+            lines.append(f"# HELP rata_{name} {help_text}")
+            lines.append(f"# TYPE rata_{name} summary")
+            values = sorted(samples[name])
+            for quantile in self.QUANTILES:
+                if values:
+                    value = values[min(len(values) - 1, int(quantile * len(values)))]
+                    lines.append(f'rata_{name}{{quantile="{quantile}"}} {value:.6f}')
+            lines.append(f"rata_{name}_sum {sums[name]:.6f}")
+            lines.append(f"rata_{name}_count {counts[name]}")
+        for name, help_text in self.COUNTERS.items():
+            lines.append(f"# HELP rata_{name} {help_text}")
+            lines.append(f"# TYPE rata_{name} counter")
+            for label, value in sorted(counters[name].items(), key=lambda item: str(item[0])):
+                labels = f'{{player="{label}"}}' if label else ""
+                lines.append(f"rata_{name}{labels} {value}")
+        lines.append("# TYPE rata_resident_memory_bytes gauge")
+        lines.append(f"rata_resident_memory_bytes {get_current_rss_kb() * 1024}")
+        lines.append("# TYPE rata_threads gauge")
+        lines.append(f"rata_threads {get_thread_count()}")
+        lines.append("# TYPE rata_python_threads gauge")
+        lines.append(f"rata_python_threads {threading.active_count()}")
+        lines.append("# TYPE rata_start_time_seconds gauge")
+        lines.append(f"rata_start_time_seconds {self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=None):
+        path = path or METRICS_FILE
+        try:
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(temp_path, path)  # Readers never see a half-written file
+        except OSError as e:
+            logging.error(f"Failed to write metrics file: {e}")
+
+    def serve_http(self, port):
+        metrics = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the log
+
+        try:
+            self.http_server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        except OSError as e:
+            logging.error(f"Could not start metrics endpoint on port {port}: {e}")
+            return
+        threading.Thread(target=self.http_server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+    def close(self):
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+# VLC is imported on first use, so tools that never play audio (simulate.py) start without it
+vlc = None
+
+def load_vlc():
+    global vlc
+    if vlc is None:
+        import vlc as vlc_module
+        vlc = vlc_module
+    return vlc
+
 class RadioPlayer:
-    def __init__(self, audio_device_name):
+    # One vlc.Instance shared by all zones of a multi-zone station, so the
+    # VLC core and its plugins are only loaded once / Jagatud VLC instants
+    _shared_instance = None
+    _shared_users = 0
+
+    def __init__(self, audio_device_name, event_callback=None, metrics=None, shared_instance=False):
         self.audio_device_name = audio_device_name
+        # With a shared instance the output device is set on each media player instead of the instance
+        self.shared_instance = shared_instance
+        # Called from VLC's event thread as event_callback(kind). It must not call back into libvlc.
+        self.event_callback = event_callback
+        self.metrics = metrics or Metrics()
+        self._track_ended_at = None  # monotonic time of the last end of track, for the gap metric
         self.instance = None
+        # Background music runs on two players: the active one and a standby
+        # one that holds the next track opened and buffered, paused at its first frame.
         self.player = None
+        self.standby_player = None
+        self.standby_path = None
+        self.fading_player = None  # previous track while a crossfade is running
+        self.crossfade_ms = 0
+        self._crossfade_posted = False
+        self._lengths = {}  # player -> length of its current media in ms, as reported by VLC
+        self._gains = {}  # player -> loudness gain of its current track
+        self.announcement_player = None
+        self.announcement_cache = {}  # path -> pre-parsed vlc.Media for today's announcements
         self.current_volume = 100
         self._init_vlc()
 
     def _init_vlc(self):
         # Release existing resources if any
-        if self.player:
-            self.player.release()
-            self.player = None
-        if self.instance:
+        for player in (self.player, self.standby_player, self.fading_player, self.announcement_player):
+            if player:
+                player.release()
+        self.player = self.standby_player = self.fading_player = self.announcement_player = None
+        self.standby_path = None
+        self._lengths = {}
+        self._gains = {}
+        # Cached media belong to the old instance / Puhverdatud meedia kuulub vanale instantsile
+        for media in self.announcement_cache.values():
+            media.release()
+        self.announcement_cache = {}
+        if self.instance and not self.shared_instance:
             self.instance.release()
             self.instance = None
 
@@ -104,31 +594,194 @@ class RadioPlayer:
              logging.warning("No audio device provided to RadioPlayer, using default device.")
 
         try:
-            self.instance = vlc.Instance(*args)
-            self.player = self.instance.media_player_new()
+            load_vlc()
+            if self.shared_instance:
+                if self.instance is None:
+                    self.instance = self._acquire_shared_instance()
+            else:
+                self.instance = vlc.Instance(*args)
+            self.player = self._new_player()
+            self._attach_track_events(self.player)
+            self.standby_player = self._new_player()
+            self._attach_track_events(self.standby_player)
+            # Dedicated player so announcements never block or replace the music
+            self.announcement_player = self._new_player()
+            self._attach_events(self.announcement_player, "announcement")
             logging.info(f"Initialized VLC Instance with device: {self.audio_device_name}")
         except Exception as e:
              logging.error(f"Failed to initialize VLC: {e}")
 
-    def play_file(self, file_path, volume=None):
+    @classmethod
+    def _acquire_shared_instance(cls):
+        if cls._shared_instance is None:
+            cls._shared_instance = vlc.Instance('--aout=alsa')
+        cls._shared_users += 1
+        return cls._shared_instance
+
+    @classmethod
+    def _release_shared_instance(cls):
+        cls._shared_users -= 1
+        if cls._shared_users == 0 and cls._shared_instance is not None:
+            cls._shared_instance.release()
+            cls._shared_instance = None
+
+    def _new_player(self):
+        player = self.instance.media_player_new()
+        if self.shared_instance and self.audio_device_name:
+            player.audio_output_device_set('alsa', self.audio_device_name)
+        return player
+
+    def _attach_events(self, player, prefix):
+        if not self.event_callback:
+            return
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, lambda event: self.event_callback(f"{prefix}_end"))
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, lambda event: self._on_error(prefix, f"{prefix}_error"))
+
+    def _on_error(self, label, kind):
+        self.metrics.increment('vlc_errors_total', label)
+        self.event_callback(kind)
+
+    def _attach_track_events(self, player):
+        # The two music players swap roles, so events are only passed on
+        # while they come from the player that is currently active.
+        if not self.event_callback:
+            return
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, lambda event: self._on_track_event(player, "track_end"))
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, lambda event: self._on_track_event(player, "track_error"))
+        events.event_attach(vlc.EventType.MediaPlayerLengthChanged, lambda event: self._lengths.__setitem__(player, event.u.new_length))
+        events.event_attach(vlc.EventType.MediaPlayerTimeChanged, lambda event: self._on_time_changed(player, event.u.new_time))
+        events.event_attach(vlc.EventType.MediaPlayerPlaying, lambda event: self._on_playing(player))
+
+    def _on_playing(self, player):
+        # Measured here in VLC's thread so the main loop does not have to wake up for it
+        if player is self.player and self._track_ended_at is not None:
+            self.metrics.observe('track_gap_seconds', time.monotonic() - self._track_ended_at)
+            self._track_ended_at = None
+
+    def _on_track_event(self, player, kind):
+        if kind == "track_error":
+            self.metrics.increment('vlc_errors_total', "track" if player is self.player else "standby")
+        if player is self.player:
+            if kind == "track_end":
+                self._track_ended_at = time.monotonic()
+            self.event_callback(kind)
+        elif player is self.standby_player and kind == "track_error":
+            # The preloaded track is broken, fall back to a normal start at end of track
+            logging.error(f"Could not preload {self.standby_path}.")
+            self.standby_path = None
+
+    def _on_time_changed(self, player, new_time):
+        if player is not self.player or not self.crossfade_ms or self._crossfade_posted or not self.standby_path:
+            return
+        length = self._lengths.get(player, 0)
+        if length > self.crossfade_ms and new_time >= length - self.crossfade_ms:
+            self._crossfade_posted = True
+            self.event_callback("track_crossfade")
+
+    def _volume_for(self, player, level=None):
+        # VLC volume for player: level (default current_volume) times the loudness gain of its track
+        level = self.current_volume if level is None else level
+        return min(200, round(level * self._gains.get(player, 1.0)))
+
+    def play_file(self, file_path, volume=None, start_seconds=0, gain=1.0):
         if not self.instance or not self.player:
              logging.error("VLC not initialized, cannot play.")
-             return
+             return False
 
         if not os.path.exists(file_path):
             logging.error(f"File not found: {file_path}")
-            return
+            return False
 
         if volume is not None:
              self.current_volume = volume
 
         media = self.instance.media_new(file_path)
+        if start_seconds:
+            media.add_option(f":start-time={start_seconds:.3f}")
         self.player.set_media(media)
-        self.player.audio_set_volume(self.current_volume)
+        self._gains[self.player] = gain
+        self.player.audio_set_volume(self._volume_for(self.player))
+        self._crossfade_posted = False
         self.player.play()
-        logging.info(f"Started playing {file_path} with volume {self.current_volume}.")
+        self.metrics.increment('tracks_played_total')
+        if start_seconds:
+            logging.info(f"Resumed playing {file_path} at {start_seconds:.1f} s with volume {self._volume_for(self.player)}.")
+        else:
+            logging.info(f"Started playing {file_path} with volume {self._volume_for(self.player)}.")
+        return True
+
+    def preload_next(self, file_path, gain=1.0):
+        """
+        Opens the next track on the standby player and lets VLC buffer it,
+        paused at its first frame, so swap_to_standby() can start it
+        without any file open or decoder start-up gap.
+        """
+        if not self.instance or not self.standby_player or file_path == self.standby_path:
+            return
+        if not os.path.exists(file_path):
+            logging.error(f"File not found: {file_path}")
+            return
+
+        media = self.instance.media_new(file_path)
+        media.add_option(':start-paused')
+        self.standby_player.set_media(media)
+        self._gains[self.standby_player] = gain
+        self.standby_player.audio_set_volume(self._volume_for(self.standby_player))
+        self.standby_player.play()
+        self.standby_path = file_path
+
+    def swap_to_standby(self):
+        # Returns the path of the started track, or None if nothing was preloaded
+        file_path = self.standby_path
+        if not file_path:
+            return None
+        self.player, self.standby_player = self.standby_player, self.player
+        self.standby_path = None
+        self._crossfade_posted = False
+        self.player.audio_set_volume(self._volume_for(self.player))
+        self.player.set_pause(0)
+        self.standby_player.stop()
+        self.metrics.increment('tracks_played_total')
+        logging.info(f"Started playing {file_path} with volume {self._volume_for(self.player)} (gapless).")
+        return file_path
+
+    def begin_crossfade(self):
+        # Starts the preloaded track silently next to the ending one
+        file_path = self.standby_path
+        if not file_path or self.fading_player:
+            return None
+        self.fading_player, self.player, self.standby_player = self.player, self.standby_player, None
+        self.standby_path = None
+        self._crossfade_posted = False
+        self._track_ended_at = None  # Overlapping tracks have no gap
+        self.player.audio_set_volume(0)
+        self.player.set_pause(0)
+        self.metrics.increment('tracks_played_total')
+        logging.info(f"Started playing {file_path} with volume {self._volume_for(self.player)} (crossfade).")
+        return file_path
+
+    def crossfade_step(self, fraction):
+        if not self.fading_player:
+            return
+        incoming = int(self.current_volume * fraction)
+        self.player.audio_set_volume(self._volume_for(self.player, incoming))
+        self.fading_player.audio_set_volume(self._volume_for(self.fading_player, self.current_volume - incoming))
+
+    def end_crossfade(self):
+        if not self.fading_player:
+            return
+        self.fading_player.stop()
+        self.player.audio_set_volume(self._volume_for(self.player))
+        self.standby_player, self.fading_player = self.fading_player, None
 
     def stop(self):
+        if self.fading_player:
+            self.end_crossfade()
+        if self.standby_player:
+            self.standby_player.stop()
+            self.standby_path = None
         if self.player:
             self.player.stop()
             logging.info("Stopped playback.")
@@ -136,35 +789,96 @@ class RadioPlayer:
     def set_volume(self, volume):
         self.current_volume = volume
         if self.player:
-            self.player.audio_set_volume(volume)
+            self.player.audio_set_volume(self._volume_for(self.player))
+        if self.standby_player:
+            self.standby_player.audio_set_volume(self._volume_for(self.standby_player))
+
+    def current_length(self):
+        # Length of the active track in ms as reported by VLC, 0 if not known yet
+        return self._lengths.get(self.player, 0)
+
+    def current_position(self):
+        # Playback position of the active track in seconds
+        if not self.player:
+            return 0
+        return max(self.player.get_time(), 0) / 1000
 
     def get_state(self):
         if self.player:
             return self.player.get_state()
         return vlc.State.NothingSpecial
 
-    def play_announcement(self, file_path):
+    def diagnostics(self):
+        # State of each VLC player, for a diagnostics bundle
+        players = {'track': self.player, 'standby': self.standby_player, 'fading': self.fading_player,
+                   'announcement': self.announcement_player}
+        return {'device': self.audio_device_name,
+                'instance_open': self.instance is not None,
+                'volume': self.current_volume,
+                'standby_path': self.standby_path,
+                'players': {name: {'state': str(player.get_state()), 'time_ms': player.get_time(),
+                                   'length_ms': self._lengths.get(player), 'volume': player.audio_get_volume()}
+                            for name, player in players.items() if player},
+                'preloaded_announcements': len(self.announcement_cache)}
+
+    def preload_announcements(self, file_paths):
+        """
+        Opens and parses the given announcement files ahead of time so that
+        play_announcement() can start them without any file or parse delay.
+        Media no longer in the list are released.
+        """
         if not self.instance:
             return
+        wanted = set(file_paths)
+        for file_path in list(self.announcement_cache):
+            if file_path not in wanted:
+                self.announcement_cache.pop(file_path).release()
+        for file_path in wanted:
+            if file_path in self.announcement_cache:
+                continue
+            if not os.path.exists(file_path):
+                logging.error(f"Announcement file not found: {file_path}")
+                continue
+            media = self.instance.media_new(file_path)
+            # Parsing runs in VLC's background thread and reads the duration
+            media.parse_with_options(vlc.MediaParseFlag.local, 0)
+            self.announcement_cache[file_path] = media
+            logging.info(f"Preloaded announcement: {file_path}")
 
-        if not os.path.exists(file_path):
-            logging.error(f"Announcement file not found: {file_path}")
-            return
-
-        # Create a temporary player from the same instance
-        temp_player = self.instance.media_player_new()
-        media = self.instance.media_new(file_path)
-        temp_player.set_media(media)
-        temp_player.audio_set_volume(100)
-        temp_player.play()
+    def play_announcement(self, file_path):
+        """
+        Starts an announcement on the dedicated announcement player and
+        returns right away. Completion is reported through event_callback
+        as "announcement_end" or "announcement_error".
+
+        Returns the announcement duration in seconds (None if not known
+        yet), or False if it could not be started.
+        """
+        if not self.instance or not self.announcement_player:
+            return False
+
+        media = self.announcement_cache.get(file_path)
+        if media is None:
+            if not os.path.exists(file_path):
+                logging.error(f"Announcement file not found: {file_path}")
+                return False
+            logging.warning(f"Announcement was not preloaded, opening it now: {file_path}")
+            media = self.instance.media_new(file_path)
+            self.announcement_cache[file_path] = media
+
+        self.announcement_player.set_media(media)
+        self.announcement_player.audio_set_volume(100)
+        self.announcement_player.play()
+        self.metrics.increment('announcements_played_total')
         logging.info(f"Playing announcement: {file_path}")
 
-        while temp_player.get_state() != vlc.State.Ended:
-            time.sleep(0.5)
+        duration = media.get_duration()  # milliseconds, -1 if not parsed
+        return duration / 1000 if duration > 0 else None
 
-        temp_player.stop()
-        temp_player.release()
-        logging.info("Announcement finished.")
+    def stop_announcement(self):
+        if self.announcement_player:
+            self.announcement_player.stop()
+            logging.info("Announcement finished.")
 
     def update_device(self, new_device_name):
         if new_device_name != self.audio_device_name:
@@ -175,6 +889,29 @@ class RadioPlayer:
             return True
         return False
 
+    def reopen(self):
+        # Creates the VLC instance and players again after release()
+        if self.instance is None:
+            self._init_vlc()
+
+    def release(self):
+        # Frees the media players and the VLC instance (or this player's share of it)
+        self.stop()
+        for player in (self.player, self.standby_player, self.fading_player, self.announcement_player):
+            if player:
+                player.release()
+        self.player = self.standby_player = self.fading_player = self.announcement_player = None
+        self.standby_path = None
+        for media in self.announcement_cache.values():
+            media.release()
+        self.announcement_cache = {}
+        if self.instance:
+            if self.shared_instance:
+                self._release_shared_instance()
+            else:
+                self.instance.release()
+            self.instance = None
+
 # Function to load configuration file / Funktsioon konfiguratsioonifaili laadimiseks
 def load_config(file_path):
     try:
@@ -186,15 +923,11 @@ def load_config(file_path):
         logging.error(f"Error loading configuration file: {e}")
         return None
 
-# Function to get current time / Funktsioon praeguse aja saamiseks
-def get_current_time():
-    return datetime.now().replace(microsecond=0).time()
-
 # Function to determine today's schedule / Funktsioon tänase ajakava määramiseks
-def get_today_schedule(config):
+def get_today_schedule(config, day_name=None):
     default_open_time = config['default_open_time']
     default_close_time = config['default_close_time']
-    today = datetime.today().strftime('%A').lower()  # Get today's day name / Saate tänase päeva nime
+    today = day_name or DAY_NAMES[datetime.today().weekday()]  # Get today's day name / Saate tänase päeva nime
 
     schedule = config['weekly_schedule'].get(today, {})
     open_time = schedule.get('open_time', default_open_time)
@@ -203,99 +936,242 @@ def get_today_schedule(config):
     return open_time, close_time
 
 # Function to determine today's announcements / Funktsioon tänaste teadaannete määramiseks
-def get_today_announcements(config):
+def get_today_announcements(config, day_name=None):
     default_announcements = config.get('default_announcements', {})
-    today = datetime.today().strftime('%A').lower()  # Get today's day name / Saate tänase päeva nime
+    today = day_name or DAY_NAMES[datetime.today().weekday()]  # Get today's day name / Saate tänase päeva nime
 
     announcements = config.get('announcements', {}).get(today, default_announcements)
     if not announcements:
         announcements = default_announcements
     return announcements
 
-# Function to check if the current time is between two times / Funktsioon kontrollimaks, kas praegune aeg on kahe aja vahel
-def is_time_between(begin_time, end_time, check_time=None):
-    check_time = check_time or get_current_time()
-    if begin_time < end_time:
-        return check_time >= begin_time and check_time <= end_time
-    else:  # When the time period spans midnight / Kui ajavahemik ületab südaöö
-        return check_time >= begin_time or check_time <= end_time
+# Function to convert "HH:MM" to minutes after midnight / Funktsioon "HH:MM" teisendamiseks minutiteks
+def parse_minutes(time_str):
+    parsed = datetime.strptime(time_str, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
 
+# Function to convert "HH:MM" or "HH:MM:SS" to seconds after midnight / Funktsioon aja teisendamiseks sekunditeks
+def parse_seconds(time_str):
+    parsed = datetime.strptime(time_str, "%H:%M:%S" if time_str.count(":") == 2 else "%H:%M")
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+class CompiledSchedule:
+    """
+    config.toml compiled into a week timeline: music windows in minutes,
+    announcements to the second. Both are kept in sorted arrays for bisect lookups, and a
+    bytearray with one entry per minute of the week answers "is music on
+    right now" in constant time. Date exceptions (holidays, special events)
+    are compiled per date and take precedence over the weekly schedule.
+
+    The compiled form is cached in SCHEDULE_CACHE next to the hash of the
+    config it was built from.
+    """
+    VERSION = 2
+
+    def __init__(self, day_windows, announcements, exceptions):
+        # day_windows[weekday]: (start, end) in minutes from that day's midnight; start may be
+        # negative and end past 1440, the window is only anchored to the day it belongs to.
+        self.day_windows = day_windows
+        # announcements: sorted (second of week, file) / Sorteeritud teadaanded
+        self.announcements = announcements
+        self.announcement_seconds = [second for second, _ in announcements]
+        # exceptions: "YYYY-MM-DD" -> {"window": (start, end) or None, "announcements": [(second, file)]}
+        self.exceptions = exceptions
+        self.open_mask = bytearray(MINUTES_PER_WEEK)
+        for weekday, window in enumerate(day_windows):
+            if window:
+                start, end = window
+                for minute in range(weekday * MINUTES_PER_DAY + start, weekday * MINUTES_PER_DAY + end):
+                    self.open_mask[minute % MINUTES_PER_WEEK] = 1
+
+    @classmethod
+    def compile(cls, config):
+        # Raises ValueError on malformed times / Tõstab ValueErrori vigaste aegade korral
+        day_windows = [cls._compile_window(config, *get_today_schedule(config, day_name)) for day_name in DAY_NAMES]
+
+        announcements = []
+        for weekday, day_name in enumerate(DAY_NAMES):
+            for time_str, announcement_file in get_today_announcements(config, day_name).items():
+                announcements.append((weekday * SECONDS_PER_DAY + parse_seconds(time_str), announcement_file))
+        announcements.sort()
+
+        exceptions = {}
+        for date_str, exception in config.get('date_exceptions', {}).items():
+            weekday = datetime.strptime(date_str, "%Y-%m-%d").weekday()
+            if exception.get('closed', False):
+                window = None
+            else:
+                open_time, close_time = get_today_schedule(config, DAY_NAMES[weekday])
+                window = cls._compile_window(config, exception.get('open_time', open_time), exception.get('close_time', close_time))
+            if 'announcements' in exception:
+                exception_announcements = sorted((parse_seconds(t), f) for t, f in exception['announcements'].items())
+            elif window is None:
+                exception_announcements = []  # Closed days are silent unless announcements are listed
+            else:
+                day_start = weekday * SECONDS_PER_DAY
+                exception_announcements = [(second - day_start, f) for second, f in announcements
+                                           if day_start <= second < day_start + SECONDS_PER_DAY]
+            exceptions[date_str] = {"window": window, "announcements": exception_announcements}
+
+        return cls(day_windows, announcements, exceptions)
+
+    @staticmethod
+    def _compile_window(config, open_time_str, close_time_str):
+        start = parse_minutes(open_time_str) - config['time_before_opening']
+        end = parse_minutes(close_time_str) + config['time_after_closing']
+        if end <= start:  # When the window spans midnight / Kui aken ületab südaöö
+            end += MINUTES_PER_DAY
+        return start, end
+
+    @classmethod
+    def load_or_compile(cls, config, config_hash, cache_path=SCHEDULE_CACHE):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == cls.VERSION and cached.get('config_hash') == config_hash:
+                return cls(
+                    [tuple(window) if window else None for window in cached['day_windows']],
+                    [tuple(entry) for entry in cached['announcements']],
+                    {date_str: {"window": tuple(e['window']) if e['window'] else None,
+                                "announcements": [tuple(entry) for entry in e['announcements']]}
+                     for date_str, e in cached['exceptions'].items()})
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        schedule = cls.compile(config)
+        try:
+            temp_path = cache_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": cls.VERSION, "config_hash": config_hash, "day_windows": schedule.day_windows,
+                           "announcements": schedule.announcements, "exceptions": schedule.exceptions}, f)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write schedule cache: {e}")
+        return schedule
+
+    def window_for(self, day):
+        # Music window of a date as datetimes, or None when closed
+        exception = self.exceptions.get(day.strftime("%Y-%m-%d"))
+        window = exception["window"] if exception else self.day_windows[day.weekday()]
+        if window is None:
+            return None
+        midnight = datetime.combine(day, datetime.min.time())
+        return midnight + timedelta(minutes=window[0]), midnight + timedelta(minutes=window[1])
+
+    def announcements_for(self, day):
+        # Announcements of a date as (datetime, file), in time order
+        midnight = datetime.combine(day, datetime.min.time())
+        exception = self.exceptions.get(day.strftime("%Y-%m-%d"))
+        if exception:
+            return [(midnight + timedelta(seconds=second), f) for second, f in exception["announcements"]]
+        day_start = day.weekday() * SECONDS_PER_DAY
+        first = bisect.bisect_left(self.announcement_seconds, day_start)
+        last = bisect.bisect_left(self.announcement_seconds, day_start + SECONDS_PER_DAY)
+        return [(midnight + timedelta(seconds=second - day_start), f) for second, f in self.announcements[first:last]]
+
+    def is_open(self, now):
+        # A window can start on the previous day (time_before_opening) or end on the next one
+        days = [now.date() + timedelta(days=offset) for offset in (-1, 0, 1)]
+        if self.exceptions and any(day.strftime("%Y-%m-%d") in self.exceptions for day in days):
+            for day in days:
+                window = self.window_for(day)
+                if window and window[0] <= now < window[1]:
+                    return True
+            return False
+        return bool(self.open_mask[now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute])
+
+ASOUND_CARDS = "/proc/asound/cards"
+ASOUND_PCM = "/proc/asound/pcm"
+# Example line in /proc/asound/cards: " 0 [Headphones     ]: bcm2835_headpho - bcm2835 Headphones"
+ASOUND_CARD_PATTERN = re.compile(r"^\s*(\d+) \[.*\]: .* - (.*)$")
+# Example line in /proc/asound/pcm: "00-00: bcm2835 Headphones : bcm2835 Headphones : playback 8"
+ASOUND_PCM_PATTERN = re.compile(r"^(\d+)-(\d+): (.*?) : (.*?) :(.*)$")
+
+# Function to find the Raspberry Pi audio device / Funktsioon Raspberry Pi heliseadme leidmiseks
 def detect_raspberry_pi_audio_device() -> Union[str, None]:
     logging.info("Attempting to auto-detect Raspberry Pi audio device...")
     try:
-        # Try parsing 'aplay -l' output
-        result = subprocess.run(['aplay', '-l'], capture_output=True, text=True, check=False)
-        if result.returncode == 0:
-            lines = result.stdout.splitlines()
-            # Regex to find card number, device number, and description
-            # Example line: card 0: Headphones [bcm2835 Headphones], device 0: Headphones [Headphones]
-            # Or: card 0: bcm2835_alsa [bcm2835 ALSA], device 0: bcm2835 ALSA [bcm2835 ALSA]
-            # We are looking for hw:card,device
-            device_pattern = re.compile(r"card (\d+): .*\[(.*)\].*device (\d+):")
-
-            found_devices = []
-            for line in lines:
-                match = device_pattern.search(line)
-                if match:
-                    card_num = match.group(1)
-                    description = match.group(2).lower() # Full description in brackets
-                    device_num = match.group(3) # Device number for that card. Often 0 for primary.
-
-                    # Check for keywords indicating analog/headphone output
-                    # Prioritize "Headphones". Also consider "Analogue", "Analog", "bcm2835 ALSA" (common for Pi).
-                    # Avoid HDMI if other options are present.
-                    is_headphone = "headphones" in description
-                    is_analog = "analog" in description or "analogue" in description
-                    is_bcm2835 = "bcm2835" in description # Often the Pi's general audio
-                    is_hdmi = "hdmi" in description
-
-                    if is_headphone or is_analog or (is_bcm2835 and not is_hdmi):
-                        device_str = f"hw:{card_num},{device_num}"
-                        logging.info(f"Found potential device: {device_str} with description: {description}")
-                        # Prioritize "Headphones"
-                        if is_headphone:
-                            found_devices.insert(0, device_str) # Add to front
-                        else:
-                            found_devices.append(device_str)
-
-            if found_devices:
-                selected_device = found_devices[0] # Take the best match
-                logging.info(f"Auto-detected audio device from 'aplay -l': {selected_device}")
-                return selected_device
-
-        else:
-            logging.warning(f"'aplay -l' command failed or returned non-zero exit code: {result.returncode}. Stderr: {result.stderr}")
-
-    except FileNotFoundError:
-        logging.warning("'aplay' command not found. Cannot auto-detect using 'aplay -l'.")
-    except Exception as e:
-        logging.error(f"Error during 'aplay -l' parsing: {e}")
-
-    # Fallback to common ALSA names if 'aplay -l' fails or yields no suitable device
+        with open(ASOUND_CARDS) as f:
+            cards_text = f.read()
+        with open(ASOUND_PCM) as f:
+            pcm_text = f.read()
+    except OSError as e:
+        logging.warning(f"Cannot read the ALSA card list ({e}).")
+        cards_text = pcm_text = None
+
+    if cards_text is not None:
+        # The result only changes when the sound cards change / Tulemus muutub ainult helikaartide muutumisel
+        cache_key = hashlib.md5((cards_text + pcm_text).encode()).hexdigest()
+        try:
+            with open(AUDIO_DEVICE_CACHE) as f:
+                cached = json.load(f)
+            if cached.get('key') == cache_key:
+                logging.info(f"Auto-detected audio device (cached): {cached['device']}")
+                return cached['device']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        selected_device = pick_alsa_device(cards_text, pcm_text)
+        if selected_device:
+            logging.info(f"Auto-detected audio device from /proc/asound: {selected_device}")
+            try:
+                with open(AUDIO_DEVICE_CACHE + ".tmp", "w") as f:
+                    json.dump({'key': cache_key, 'device': selected_device}, f)
+                os.replace(AUDIO_DEVICE_CACHE + ".tmp", AUDIO_DEVICE_CACHE)
+            except OSError as e:
+                logging.warning(f"Could not write audio device cache: {e}")
+            return selected_device
+
+    # Fallback to common ALSA names if the card list is unavailable or yields no suitable device
     logging.info("Falling back to trying common ALSA device names for Raspberry Pi.")
     common_devices = ["hw:0,0", "hw:1,0"] # Common for headphone jack on different Pi models
 
     for device in common_devices:
-        # device string format is "hw:X,Y". We need to check for /dev/snd/pcmCXDYp
-        try:
-            parts = device.split(':')
-            if len(parts) == 2:
-                card_device = parts[1].split(',')
-                if len(card_device) == 2:
-                    card = card_device[0]
-                    dev = card_device[1]
-                    # Check for playback device file existence
-                    # Standard ALSA device file: /dev/snd/pcmC{card}D{device}p (p for playback, c for capture)
-                    device_path = f"/dev/snd/pcmC{card}D{dev}p"
-                    if os.path.exists(device_path):
-                        logging.info(f"Verified existence of fallback device: {device} (found {device_path})")
-                        return device
-        except Exception as e:
-            logging.error(f"Error checking device existence for {device}: {e}")
+        card, dev = device[3:].split(',')
+        # Standard ALSA device file: /dev/snd/pcmC{card}D{device}p (p for playback, c for capture)
+        device_path = f"/dev/snd/pcmC{card}D{dev}p"
+        if os.path.exists(device_path):
+            logging.info(f"Verified existence of fallback device: {device} (found {device_path})")
+            return device
 
     logging.warning("No common ALSA devices (hw:0,0 or hw:1,0) found via file check.")
     return None # Return None to let RadioPlayer use system default
 
+# Function to score the playback devices in /proc/asound / Funktsioon /proc/asound seadmete hindamiseks
+def pick_alsa_device(cards_text, pcm_text):
+    card_names = {}
+    for line in cards_text.splitlines():
+        match = ASOUND_CARD_PATTERN.match(line)
+        if match:
+            card_names[int(match.group(1))] = match.group(2)
+
+    found_devices = []
+    for line in pcm_text.splitlines():
+        match = ASOUND_PCM_PATTERN.match(line)
+        if not match or "playback" not in match.group(5):
+            continue
+        card_num, device_num = int(match.group(1)), int(match.group(2))
+        description = f"{card_names.get(card_num, '')} {match.group(4)}".lower()
+
+        # Check for keywords indicating analog/headphone output
+        # Prioritize "Headphones". Also consider "Analogue", "Analog", "bcm2835 ALSA" (common for Pi).
+        # Avoid HDMI if other options are present.
+        is_headphone = "headphones" in description
+        is_analog = "analog" in description or "analogue" in description
+        is_bcm2835 = "bcm2835" in description # Often the Pi's general audio
+        is_hdmi = "hdmi" in description
+
+        if is_headphone or is_analog or (is_bcm2835 and not is_hdmi):
+            device_str = f"hw:{card_num},{device_num}"
+            logging.info(f"Found potential device: {device_str} with description: {description}")
+            # Prioritize "Headphones"
+            if is_headphone:
+                found_devices.insert(0, device_str) # Add to front
+            else:
+                found_devices.append(device_str)
+
+    return found_devices[0] if found_devices else None
+
 # Function to check if the configuration file content has changed / Funktsioon kontrollimaks, kas konfiguratsioonifaili sisu on muutunud
 def get_file_hash(file_path):
     hasher = hashlib.md5()
@@ -304,222 +1180,2059 @@ def get_file_hash(file_path):
         hasher.update(buf)
     return hasher.hexdigest()
 
+class LibraryIndex:
+    """
+    On-disk index of the music library (SQLite under WORKING_DIR). Tracks
+    are keyed by path and stored with size, mtime and format; duration is
+    filled in once VLC has played a track.
+
+    Directories are stored with their mtime. A directory's mtime only
+    changes when entries are added, removed or renamed in it, so sync()
+    re-lists just those directories and answers the rest from the index.
+    A folder's tracks are looked up by path prefix, so one folder can be
+    synced inside another (the shop on /music, the café on /music/cafe).
+
+    Loudness (integrated LUFS) and the content hash of transcoded tracks
+    are filled in by LoudnessAnalyzer and Transcoder and, like the
+    duration, reset when a file changes.
+    """
+    def __init__(self, db_path=LIBRARY_DB):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Fewer fsyncs on the SD card
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY, parent TEXT, root TEXT NOT NULL, mtime_ns INTEGER NOT NULL,
+                recursive INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY, directory TEXT NOT NULL, root TEXT NOT NULL,
+                size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, format TEXT NOT NULL, duration REAL);
+            CREATE INDEX IF NOT EXISTS tracks_root ON tracks (root, path);
+            CREATE INDEX IF NOT EXISTS tracks_directory ON tracks (directory);
+        """)
+        # Indexes created before loudness analysis existed / Enne valjuse analüüsi loodud indeksid
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(tracks)")]
+        if 'loudness' not in columns:
+            self.db.execute("ALTER TABLE tracks ADD COLUMN loudness REAL")
+        if 'content_hash' not in columns:
+            self.db.execute("ALTER TABLE tracks ADD COLUMN content_hash TEXT")
+        self.synced_roots = set()
+
+    @staticmethod
+    def _under(root, recursive):
+        # SQL condition for the tracks of root; "0" sorts right after "/"
+        if recursive:
+            return "path >= ? AND path < ?", (root + "/", root + "0")
+        return "directory = ?", (root,)
+
+    def sync(self, root, recursive=True, keep_unreachable=False):
+        """
+        Brings the index for root up to date and returns its tracks in path
+        order. Only directories whose mtime changed are listed again.
+
+        With keep_unreachable, a root that is missing or empty (a network
+        share that is not mounted yet) keeps its indexed tracks, so the
+        read-ahead cache can still find its copies of them.
+        """
+        started = time.monotonic()
+        root = os.path.normpath(root)
+        self.synced_roots.add((root, recursive))
+        if keep_unreachable and not self._listable(root):
+            condition, args = self._under(root, recursive)
+            audio_files = [path for (path,) in self.db.execute(f"SELECT path FROM tracks WHERE {condition} ORDER BY path", args)]
+            if audio_files:
+                logging.warning(f"Music folder {root} is empty or not reachable, using its {len(audio_files)} indexed tracks.")
+                return audio_files
+        # root and the folders inside it, whichever sync stored them / root ja selle alamkaustad
+        query, args = "SELECT path, mtime_ns, recursive FROM directories WHERE path = ?", (root,)
+        if recursive:
+            condition, condition_args = self._under(root, True)
+            query, args = f"{query} OR ({condition})", args + condition_args
+        known = {path: (mtime_ns, bool(was_recursive)) for path, mtime_ns, was_recursive in self.db.execute(query, args)}
+        children = {}
+        for path in known:
+            if path != root:
+                children.setdefault(os.path.dirname(path), []).append(path)
+
+        seen = set()
+        rescanned = 0
+        pending = [(root, None)]
+        while pending:
+            directory, parent = pending.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(directory)
+            if known.get(directory) == (mtime_ns, recursive):
+                subdirectories = children.get(directory, []) if recursive else []
+            else:
+                subdirectories = self._scan_directory(directory, parent, root, mtime_ns, recursive)
+                rescanned += 1
+            pending.extend((subdirectory, directory) for subdirectory in subdirectories)
+
+        for gone in set(known) - seen:
+            self.db.execute("DELETE FROM directories WHERE path = ?", (gone,))
+            self.db.execute("DELETE FROM tracks WHERE directory = ?", (gone,))
+        self.db.commit()
+
+        condition, args = self._under(root, recursive)
+        audio_files = [path for (path,) in self.db.execute(f"SELECT path FROM tracks WHERE {condition} ORDER BY path", args)]
+        logging.info(f"Music library {root}: {len(audio_files)} tracks, {rescanned} of {len(seen)} folders rescanned in {time.monotonic() - started:.3f} s.")
+        return audio_files
+
+    @staticmethod
+    def _listable(directory):
+        try:
+            with os.scandir(directory) as entries:
+                return next(entries, None) is not None
+        except OSError:
+            return False
+
+    def _scan_directory(self, directory, parent, root, mtime_ns, recursive):
+        subdirectories = []
+        present = set()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if recursive:
+                            subdirectories.append(entry.path)
+                        continue
+                    extension = os.path.splitext(entry.name)[1].lower()
+                    if extension not in AUDIO_EXTENSIONS or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError as e:
+                    logging.warning(f"Could not read {entry.path}: {e}")
+                    continue
+                present.add(entry.path)
+                # Keep metadata of unchanged files, reset it for changed ones
+                self.db.execute("""
+                    INSERT INTO tracks (path, directory, root, size, mtime_ns, format) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, duration = NULL, loudness = NULL, content_hash = NULL
+                    WHERE size != excluded.size OR mtime_ns != excluded.mtime_ns
+                """, (entry.path, directory, root, stat.st_size, stat.st_mtime_ns, extension[1:]))
+
+        for (path,) in self.db.execute("SELECT path FROM tracks WHERE directory = ?", (directory,)).fetchall():
+            if path not in present:
+                self.db.execute("DELETE FROM tracks WHERE path = ?", (path,))
+        self.db.execute("INSERT OR REPLACE INTO directories (path, parent, root, mtime_ns, recursive) VALUES (?, ?, ?, ?, ?)",
+                        (directory, parent, root, mtime_ns, recursive))
+        return subdirectories
+
+    def set_duration(self, path, duration):
+        self.db.execute("UPDATE tracks SET duration = ? WHERE path = ?", (duration, path))
+        self.db.commit()
+
+    def set_track_value(self, path, column, value):
+        # column is one of the analysis columns, never user input
+        self.db.execute(f"UPDATE tracks SET {column} = ? WHERE path = ?", (value, path))
+        self.db.commit()
+
+    def tracks_missing(self, column, formats=None):
+        # New and changed tracks of the folders in use / Kasutusel kaustade uued ja muutunud lood
+        paths = {}  # dict: folders synced inside each other share tracks
+        for root, recursive in sorted(self.synced_roots):
+            condition, args = self._under(root, recursive)
+            paths.update((path, None) for path, track_format in self.db.execute(
+                f"SELECT path, format FROM tracks WHERE {condition} AND {column} IS NULL ORDER BY path", args)
+                if formats is None or track_format in formats)
+        return list(paths)
+
+    def track_values(self, column, formats=None):
+        # (path, value) of the tracks of the folders in use that have a value / Väärtusega lood
+        values = {}
+        for root, recursive in sorted(self.synced_roots):
+            condition, args = self._under(root, recursive)
+            values.update((path, value) for path, track_format, value in self.db.execute(
+                f"SELECT path, format, {column} FROM tracks WHERE {condition} AND {column} IS NOT NULL ORDER BY path", args)
+                if formats is None or track_format in formats)
+        return list(values.items())
+
+    def get_track(self, path):
+        row = self.db.execute("SELECT size, mtime_ns, format, duration, loudness, content_hash FROM tracks WHERE path = ?",
+                              (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime_ns", "format", "duration", "loudness", "content_hash"), row))
+
+    def close(self):
+        self.db.close()
+
+# Function to measure the integrated loudness of a file / Funktsioon faili valjuse mõõtmiseks
+def measure_loudness(file_path):
+    # Runs in a LoudnessAnalyzer worker process. Returns EBU R128 integrated loudness in LUFS, or None.
+    try:
+        result = subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-i", file_path,
+                                 "-af", "ebur128=framelog=quiet", "-f", "null", "-"],
+                                capture_output=True, text=True, timeout=600)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(r"I:\s+(-?[\d.]+) LUFS", result.stderr.rsplit("Summary:", 1)[-1])
+    return float(match.group(1)) if match else None
+
+# Function to check that a WAV file is complete / Funktsioon WAV-faili terviklikkuse kontrollimiseks
+def is_complete_wav(file_path):
+    # The RIFF header holds the file size minus 8; a cut-off file does not match it
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(12)
+            size = os.fstat(f.fileno()).st_size
+    except OSError:
+        return False
+    return (len(header) == 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+            and struct.unpack("<I", header[4:8])[0] == size - 8)
+
+# Function to transcode a file into the cache / Funktsioon faili teisendamiseks vahemällu
+def rendition_name(content_hash, sample_rate):
+    # One rendition per source content and output rate / Üks koopia sisu ja diskreetimissageduse kohta
+    return f"{content_hash}-{sample_rate}.wav"
+
+def transcode_track(file_path, cache_folder, sample_rate):
+    # Runs in a Transcoder worker process. Returns the content hash of file_path, or None.
+    checksum = hashlib.sha1()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                checksum.update(chunk)
+    except OSError:
+        return None
+    content_hash = checksum.hexdigest()
+    target = os.path.join(cache_folder, rendition_name(content_hash, sample_rate))
+    if is_complete_wav(target):
+        return content_hash  # the same audio under another name
+    try:
+        result = subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-y", "-i", file_path,
+                                 "-vn", "-ac", "2", "-ar", str(sample_rate), "-c:a", "pcm_s16le", "-f", "wav", target + ".tmp"],
+                                capture_output=True, timeout=1800)
+    except (OSError, subprocess.TimeoutExpired):
+        result = None
+    if result is None or result.returncode != 0 or not is_complete_wav(target + ".tmp"):
+        if os.path.exists(target + ".tmp"):
+            os.remove(target + ".tmp")
+        return None
+    os.replace(target + ".tmp", target)
+    return content_hash
+
+batch_stopping = None  # set by stop(), in the worker processes / töötajaprotsessides
+
+def init_batch_worker(pids, stopping):
+    # Low priority, and an own process group so stop() can end the worker together with its ffmpeg.
+    # The pid is reported only after setpgrp(), so stop() never signals a group that does not exist yet.
+    global batch_stopping
+    os.nice(19)
+    os.setpgrp()
+    batch_stopping = stopping
+    pids.put(os.getpid())
+
+def run_batch_task(function, *args):
+    # A worker that started after stop() collected the pids must not start ffmpeg
+    if batch_stopping is not None and batch_stopping.is_set():
+        raise RuntimeError("stopped")
+    return function(*args)
+
+class TrackBatch:
+    """
+    Runs a function over library tracks in a pool of low-priority worker
+    processes. The station runs batches only while the music is off.
+    Results come back to the main loop as "batch_result" events and are
+    stored in the library index, so playback only ever looks them up.
+
+    Subclasses set NAME and define tracks(), submit_args() and store().
+    """
+    NAME = "batch"
+
+    def __init__(self, library, event_callback, workers=1):
+        self.library = library
+        self.event_callback = event_callback  # event_callback(kind, payload), called from the pool's thread
+        self.workers = workers
+        self.pool = None
+        self.worker_pids = None  # SimpleQueue the workers report their pid to
+        self.stopping = None
+        self.pending = deque()
+        self.running = 0
+        self.failed = set()  # not retried until the next start
+
+    def tracks(self):
+        raise NotImplementedError
+
+    def submit_args(self, path):
+        raise NotImplementedError
+
+    def store(self, path, result):
+        raise NotImplementedError
+
+    def start(self):
+        if self.pool:
+            return
+        if not shutil.which("ffmpeg"):
+            logging.warning(f"ffmpeg not found, skipping {self.NAME}.")
+            return
+        self.pending = deque(path for path in self.tracks() if path not in self.failed)
+        if not self.pending:
+            return
+        logging.info(f"Starting {self.NAME} of {len(self.pending)} tracks.")
+        # spawn: forking a process that runs VLC and logging threads is not safe
+        context = multiprocessing.get_context("spawn")
+        self.worker_pids = context.SimpleQueue()
+        self.stopping = context.Event()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_batch_worker,
+                                        initargs=(self.worker_pids, self.stopping))
+        for _ in range(2 * self.workers):
+            self._submit()
+        if not self.running:
+            self.stop()
+
+    def has_room(self, path):
+        # Subclasses may stop the batch before path is submitted
+        return True
+
+    def _submit(self):
+        if not self.pool or not self.pending:
+            return
+        if not self.has_room(self.pending[0]):
+            self.pending.clear()
+            return
+        path = self.pending.popleft()
+        try:
+            future = self.pool.submit(run_batch_task, *self.submit_args(path))
+        except RuntimeError as e:  # BrokenProcessPool, or the pool is shutting down
+            logging.error(f"{self.NAME.capitalize()} stopped: {e}")
+            self.stop()
+            return
+        self.running += 1
+        future.add_done_callback(lambda future: self.event_callback("batch_result", (self, path, future)))
+
+    def on_result(self, path, future):
+        self.running -= 1
+        if future.cancelled() or (self.pool is None and future.exception() is not None):
+            return  # stopped: the track is tried again next time
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.warning(f"{self.NAME.capitalize()} of {path} failed: {e}")
+            result = None
+        if result is None:
+            self.failed.add(path)
+        else:
+            self.store(path, result)
+        self._submit()
+        if self.pool and not self.running:
+            logging.info(f"{self.NAME.capitalize()} finished.")
+            self.stop()
+
+    def stop(self):
+        # Called when the music starts: running workers and their ffmpeg must not keep the CPU busy
+        if self.pool:
+            # Set before the pids are read: a worker that has not reported yet cannot have started a task
+            self.stopping.set()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            while not self.worker_pids.empty():
+                try:
+                    os.killpg(self.worker_pids.get(), signal.SIGTERM)
+                except (ProcessLookupError, PermissionError):
+                    pass  # already gone / juba lõpetatud
+            self.worker_pids.close()
+        self.pending.clear()
+
+class LoudnessAnalyzer(TrackBatch):
+    """
+    Measures the loudness of tracks that have none in the library index
+    yet, with ffmpeg's EBU R128 filter.
+    """
+    NAME = "loudness analysis"
+
+    def tracks(self):
+        return self.library.tracks_missing('loudness')
+
+    def submit_args(self, path):
+        return measure_loudness, path
+
+    def store(self, path, loudness):
+        if loudness < -60:  # -70 LUFS is what ffmpeg reports for silence
+            self.failed.add(path)
+        else:
+            self.library.set_track_value(path, 'loudness', loudness)
+
+class Transcoder(TrackBatch):
+    """
+    Converts tracks in formats that are costly to decode (FLAC, Ogg,
+    M4A, ...) into 16-bit WAV at the output's sample rate, so playback
+    neither decodes nor resamples them. Renditions are named after the
+    SHA-1 of the source file's content and the sample rate, and stored
+    in a size-capped cache folder; the least recently played ones are
+    evicted first. The library keeps the content hash after eviction,
+    and the renditions present are the ones in the folder (cached).
+    """
+    NAME = "transcoding"
+
+    def __init__(self, library, event_callback, folder, max_mb, sample_rate, workers=1):
+        super().__init__(library, event_callback, workers)
+        self.folder = folder
+        self.max_bytes = max_mb * 1024 * 1024
+        self.sample_rate = sample_rate
+        self.cached = set()  # content hashes of the renditions in the folder at this sample rate
+        self.cache_bytes = 0
+        os.makedirs(folder, exist_ok=True)
+        self.evict()
+
+    def tracks(self):
+        self.evict()
+        paths = self.library.tracks_missing('content_hash', TRANSCODE_FORMATS)
+        # Known content without a rendition: evicted, or made at another sample rate
+        paths += [path for path, content_hash in self.library.track_values('content_hash', TRANSCODE_FORMATS)
+                  if content_hash not in self.cached]
+        return paths
+
+    def has_room(self, path):
+        # Stop before the cache overflows. Without a known duration, guess the average
+        # rendition; 16-bit stereo PCM is never smaller than the source.
+        track = self.library.get_track(path)
+        if track and track['duration']:
+            estimate = track['duration'] * self.sample_rate * 4
+        else:
+            estimate = max(track['size'] if track else 0, self.cache_bytes // len(self.cached) if self.cached else 0)
+        if self.cache_bytes + estimate > self.max_bytes:
+            logging.warning("Transcoding cache is full, the remaining tracks are played as they are.")
+            return False
+        return True
+
+    def submit_args(self, path):
+        return transcode_track, path, self.folder, self.sample_rate
+
+    def store(self, path, content_hash):
+        self.library.set_track_value(path, 'content_hash', content_hash)
+        if content_hash not in self.cached:
+            self.cached.add(content_hash)
+            self.cache_bytes += os.path.getsize(os.path.join(self.folder, rendition_name(content_hash, self.sample_rate)))
+
+    def evict(self):
+        renditions = []
+        suffix = rendition_name("", self.sample_rate)
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".tmp") or (entry.name.endswith(".wav") and not entry.name.endswith(suffix)):
+                os.remove(entry.path)  # left over from an interrupted run, or made at another sample rate
+            elif entry.name.endswith(".wav"):
+                renditions.append((entry.stat().st_mtime, entry.stat().st_size, entry.name))
+        renditions.sort()
+        self.cached = {name[:-len(suffix)] for _, _, name in renditions}
+        self.cache_bytes = sum(size for _, size, _ in renditions)
+        for _, size, name in renditions:
+            if self.cache_bytes <= self.max_bytes:
+                break
+            self.remove(name[:-len(suffix)])
+            self.cache_bytes -= size
+
+    def remove(self, content_hash):
+        try:
+            os.remove(os.path.join(self.folder, rendition_name(content_hash, self.sample_rate)))
+        except OSError:
+            pass
+        self.cached.discard(content_hash)
+
+    def resolve(self, file_path):
+        # The cached rendition of file_path, or None
+        track = self.library.get_track(file_path)
+        if not track or track['content_hash'] not in self.cached:
+            return None
+        rendition = os.path.join(self.folder, rendition_name(track['content_hash'], self.sample_rate))
+        if not is_complete_wav(rendition):
+            logging.warning(f"Transcoded copy of {file_path} is missing or damaged, playing the original.")
+            self.remove(track['content_hash'])
+            return None
+        try:
+            os.utime(rendition)  # least recently played renditions are evicted first
+        except OSError:
+            pass
+        return rendition
+
 # Function to load audio files from a folder / Funktsioon helifailide laadimiseks kaustast
-def load_audio_files(music_folder_path):
-    audio_files = []
-    if not os.path.isdir(music_folder_path):
+def load_audio_files(music_folder_path, library, recursive=True, offline_ok=False):
+    # offline_ok: the folder is a share behind the read-ahead cache and may be unreachable for now
+    if not os.path.isdir(music_folder_path) and not offline_ok:
         logging.warning(f"Music folder not found: {music_folder_path}")
-        return audio_files
-    for file in os.listdir(music_folder_path):
-        if file.lower().endswith(('.mp3', '.wav')):
-            audio_files.append(os.path.join(music_folder_path, file))
+        return []
+    audio_files = library.sync(music_folder_path, recursive, keep_unreachable=offline_ok)
     if not audio_files:
         logging.warning(f"No audio files found in music folder: {music_folder_path}")
-    else:
-        logging.info(f"Loaded audio files: {audio_files}")
     return audio_files
 
-# Main function / Põhifunktsioon
-def main():
-    config = load_config(CONFIG_PATH)  # Load the configuration file / Laadige konfiguratsioonifail
-    if config is None:
-        logging.error("Failed to load configuration. Exiting.")
-        return
 
+# Function to pick the background music folder and load it / Funktsioon taustamuusika kausta valimiseks ja laadimiseks
+def get_music_folder(config, offline_ok=False):
+    # The folder background music is loaded from, or None / Kaust, kust taustamuusika laetakse
+    music_folder_path_config = config.get('background_music_folder')
+    default_music_folder = os.path.join(WORKING_DIR, "bgmusic")
+    if music_folder_path_config and (os.path.isdir(music_folder_path_config) or offline_ok):
+        return music_folder_path_config
+    if os.path.isdir(default_music_folder):
+        return default_music_folder
+    return None
+
+def load_music_from_config(config, library, offline_ok=False):
+    music_folder = get_music_folder(config, offline_ok)
+    recursive = config.get('music_recursive', True)
+
+    if music_folder is None:
+        logging.warning("No background music folder specified in config and default 'bgmusic' folder not found. No background music will be played.")
+        return []
+    if music_folder != config.get('background_music_folder'):
+        logging.info(f"No valid 'background_music_folder' in config, using default: {music_folder}")
+    return load_audio_files(music_folder, library, recursive, offline_ok)
+
+class ReadAheadCache:
+    """
+    Local copies of the next tracks of a music library on a network share
+    (SMB/NFS), so a slow share or a short outage does not stall playback.
+    A background thread copies the tracks the zones will play next into
+    the cache folder and verifies each copy against a checksum of the data
+    read. Files are least-recently-used evicted to stay under the size cap.
+
+    Cached files are named after the source path, size and mtime recorded
+    in the library index, so finding a copy never touches the share. While
+    the share is unreachable the cache serves as an offline pool.
+    """
+    def __init__(self, library, folder, max_mb):
+        self.library = library  # only used from the main thread
+        self.folder = folder
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.offline = False
+        self.requests = queue.SimpleQueue()
+        os.makedirs(folder, exist_ok=True)
+        existing = []
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)  # copy interrupted by a restart
+            elif entry.is_file():
+                existing.append((entry.stat().st_mtime, entry.name, entry.stat().st_size))
+        for _, name, size in sorted(existing):
+            self.entries[name] = size
+        self.thread = threading.Thread(target=self._run, name="read-ahead", daemon=True)
+        self.thread.start()
+
+    def _name(self, file_path):
+        track = self.library.get_track(file_path)
+        if track is None:
+            return None
+        key = hashlib.sha1(f"{file_path}\0{track['size']}\0{track['mtime_ns']}".encode()).hexdigest()
+        return key + os.path.splitext(file_path)[1].lower()
+
+    def resolve(self, file_path):
+        # Local copy of file_path, or None if it is not cached (yet)
+        name = self._name(file_path)
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        local_path = os.path.join(self.folder, name)
+        try:
+            os.utime(local_path)  # keeps the LRU order over restarts
+        except OSError:
+            return None
+        return local_path
+
+    def offline_track(self):
+        # The least recently played cached track, so the offline pool rotates
+        with self.lock:
+            if not self.entries:
+                return None
+            name = next(iter(self.entries))
+            self.entries.move_to_end(name)
+        return os.path.join(self.folder, name)
+
+    def prefetch(self, file_paths):
+        for file_path in file_paths:
+            name = self._name(file_path)
+            if name is None:
+                continue
+            with self.lock:
+                cached = name in self.entries
+            if not cached:
+                self.requests.put((file_path, name))
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            file_path, name = request
+            with self.lock:
+                cached = name in self.entries
+            if cached:
+                continue  # requested again before the first copy finished
+            try:
+                size = self._copy(file_path, name)
+            except OSError as e:
+                if not self.offline:
+                    logging.warning(f"Music share not reachable ({e}), playing from the local cache.")
+                self.offline = True
+                continue
+            if self.offline:
+                logging.info("Music share reachable again.")
+                self.offline = False
+            if size is not None:
+                with self.lock:
+                    self.entries[name] = size
+                self._evict()
+
+    def _copy(self, file_path, name):
+        target = os.path.join(self.folder, name)
+        checksum = hashlib.sha1()
+        with open(file_path, "rb") as source, open(target + ".tmp", "wb") as copy:
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                checksum.update(chunk)
+                copy.write(chunk)
+        # Verify what reached the disk before trusting it / Kontrolli kettale jõudnud koopiat
+        verify = hashlib.sha1()
+        with open(target + ".tmp", "rb") as copy:
+            for chunk in iter(lambda: copy.read(1024 * 1024), b""):
+                verify.update(chunk)
+        if verify.digest() != checksum.digest():
+            logging.error(f"Cached copy of {file_path} is corrupt, not using it.")
+            os.remove(target + ".tmp")
+            return None
+        os.replace(target + ".tmp", target)
+        return os.path.getsize(target)
+
+    def _evict(self):
+        with self.lock:
+            total = sum(self.entries.values())
+            evicted = []
+            while total > self.max_bytes and len(self.entries) > 1:
+                name, size = self.entries.popitem(last=False)
+                total -= size
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+
+    def close(self):
+        self.requests.put(None)
+
+# Function to guess a track's artist from its path / Funktsioon loo esitaja leidmiseks failiteest
+def get_track_artist(file_path):
+    # "Artist - Title.mp3", otherwise the folder the file is in (Artist/Album/01 Title.mp3 gives the album)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if " - " in name:
+        return name.split(" - ", 1)[0].strip().lower()
+    return os.path.basename(os.path.dirname(file_path)).lower()
+
+# Function to find the setting of the most specific matching folder / Funktsioon kõige täpsema kausta seade leidmiseks
+def match_folder(file_path, folders, music_folder=None):
+    # Folders are relative paths inside the music folder, e.g. "Jazz" or "Jazz/Vocal"
+    relative_path = os.path.relpath(file_path, music_folder) if music_folder else file_path
+    best = None
+    for folder in folders:
+        if relative_path.startswith(folder.strip('/') + '/') and (best is None or len(folder) > len(best)):
+            best = folder
+    return best
+
+class WeightTree:
+    """
+    Fenwick tree over track weights: picking a track with probability
+    proportional to its weight and changing one weight are both O(log n).
+    """
+    def __init__(self, weights):
+        self.weights = array('d', weights)
+        self.size = len(self.weights)
+        self.tree = array('d', bytes(8 * (self.size + 1)))
+        for i, weight in enumerate(self.weights, 1):
+            self.tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(self.weights)
+
+    def set(self, index, weight):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        # Index of the track whose weight range contains value, 0 <= value < total
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if position + step <= self.size and self.tree[position + step] <= value:
+                position += step
+                value -= self.tree[position]
+            step >>= 1
+        return min(position, self.size - 1)
+
+class TrackPool:
+    """
+    The tracks one playlist chooses from (all of them, or a daypart's
+    folders), with the state needed to pick the next one. indices maps pool
+    positions to positions in the zone's track list; it is a range for the
+    whole library, so no copy of a large list is made.
+    """
+    def __init__(self, indices, weights, shuffle, no_repeat):
+        self.indices = indices
+        self.position = -1  # sequential order
+        self.shuffle = shuffle
+        if shuffle:
+            self.base_weights = array('d', weights)
+            self.tree = WeightTree(weights)
+            self.no_repeat = no_repeat
+            self.recent = deque()  # pool positions that may not repeat yet
+
+    def pick_sequential(self):
+        self.position = (self.position + 1) % len(self.indices)
+        return self.indices[self.position]
+
+    def pick_shuffled(self, rng, avoid):
+        # Retry a few times when the pick breaks artist separation, then accept it
+        for _ in range(Playlist.ARTIST_RETRIES):
+            position = self.tree.find(rng.random() * self.tree.total)
+            if self.tree.weights[position] > 0 and not avoid(self.indices[position]):
+                break
+        self.tree.set(position, 0)
+        self.recent.append(position)
+        if len(self.recent) > self.no_repeat:
+            released = self.recent.popleft()
+            self.tree.set(released, self.base_weights[released])
+        return self.indices[position]
+
+class Playlist:
+    """
+    Chooses the order in which a zone plays its tracks. "sequential" plays
+    them in folder order, like before. "shuffle" picks at random, weighted
+    by folder_weights, without repeating a track until half of the pool has
+    played and keeping artist_separation other tracks between two songs of
+    one artist. Dayparts limit the choice to some folders at some times of
+    day. Picking a track is O(log n) and never copies the track list.
+    """
+    # Attempts to find a track by another artist before giving up on separation
+    ARTIST_RETRIES = 10
+
+    def __init__(self, audio_files, config, clock, current=0, music_folder=None):
+        self.audio_files = audio_files
+        self.clock = clock
+        self.current = current
+        self.upcoming = deque()  # indices picked ahead of time, in play order
+        self.shuffle = config.get('playlist_order', 'sequential') == 'shuffle'
+        self.rng = random.Random(config.get('shuffle_seed'))
+        self.artist_separation = config.get('artist_separation', 0) if self.shuffle else 0
+        self.recent_artists = deque()
+
+        music_folder = music_folder or get_music_folder(config)
+        folder_weights = config.get('folder_weights', {})
+        weights = [folder_weights.get(match_folder(path, folder_weights, music_folder), 1) for path in audio_files]
+        self.pool = self._make_pool(range(len(audio_files)), weights)
+        if self.pool is None and audio_files:
+            logging.warning("folder_weights leave out every track, all tracks are played with equal weight instead.")
+            weights = [1] * len(audio_files)
+            self.pool = self._make_pool(range(len(audio_files)), weights)
+        if self.pool and not self.shuffle:
+            self.pool.position = self.pool.indices.index(current) if current in self.pool.indices else -1
+
+        self.dayparts = []  # (start minute, end minute, pool)
+        for name, daypart in config.get('dayparts', {}).items():
+            try:
+                start, end = parse_minutes(daypart['start']), parse_minutes(daypart['end'])
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                logging.error(f"Daypart {name} needs a valid start and end time (\"HH:MM\"), skipping it: {e!r}")
+                continue
+            folders = daypart.get('folders', [])
+            indices = array('I', (i for i, path in enumerate(audio_files) if match_folder(path, folders, music_folder)))
+            pool = self._make_pool(indices, [weights[i] for i in indices])
+            if pool is None:
+                logging.warning(f"Daypart {name} has no tracks, the whole playlist is used instead.")
+                continue
+            self.dayparts.append((start, end, pool))
+
+    def _make_pool(self, indices, weights):
+        if any(weight <= 0 for weight in weights):
+            # Weight 0 leaves a folder out / Kaal 0 jätab kausta välja
+            kept = [i for i, weight in enumerate(weights) if weight > 0]
+            indices = array('I', (indices[i] for i in kept))
+            weights = [weights[i] for i in kept]
+        if not indices:
+            return None
+        return TrackPool(indices, weights, self.shuffle, len(indices) // 2)
+
+    def _pool_for(self, now):
+        minute = now.hour * 60 + now.minute
+        for start, end, pool in self.dayparts:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return pool
+        return self.pool
+
+    def _breaks_separation(self, index):
+        return get_track_artist(self.audio_files[index]) in self.recent_artists
+
+    def _pick(self):
+        pool = self._pool_for(self.clock.now())
+        if self.shuffle:
+            index = pool.pick_shuffled(self.rng, self._breaks_separation)
+        else:
+            index = pool.pick_sequential()
+        if self.artist_separation:
+            self.recent_artists.append(get_track_artist(self.audio_files[index]))
+            if len(self.recent_artists) > self.artist_separation:
+                self.recent_artists.popleft()
+        self.upcoming.append(index)
+
+    def lookahead(self, count):
+        # Upcoming tracks are fixed when first asked for, so they can be preloaded and prefetched
+        while self.pool is not None and len(self.upcoming) < count:
+            self._pick()
+        return list(itertools.islice(self.upcoming, count))
+
+    def peek(self):
+        upcoming = self.lookahead(1)
+        return upcoming[0] if upcoming else None
+
+    def advance(self):
+        self.current = self.peek()
+        if self.current is not None:
+            self.upcoming.popleft()
+        return self.current
+
+# Function to pick the audio device at startup / Funktsioon heliseadme valimiseks käivitamisel
+def get_audio_device_from_config(config):
     audio_device_from_config = config.get('audio_output_device')
-    audio_device = None # Initialize audio_device to None
 
     if audio_device_from_config and audio_device_from_config.strip(): # Check if configured and not empty
         audio_device = audio_device_from_config.strip()
         logging.info(f"Using audio output device from config file: {audio_device}")
-    else:
-        if 'audio_output_device' in config: # Key exists but is empty or whitespace
-             logging.info("Audio output device is empty in config. Attempting auto-detection.")
-        else: # Key does not exist
-             logging.info("Audio output device not configured in config. Attempting auto-detection.")
-
-        detected_device = detect_raspberry_pi_audio_device()
-        if detected_device:
-            audio_device = detected_device
-            logging.info(f"Successfully auto-detected audio device: {audio_device}")
-        else:
-            logging.error("Auto-detection of audio device failed. No audio will be played. Please configure 'audio_output_device' in config.toml if you want audio output.")
-            # audio_device remains None
+        return audio_device
 
-    open_time_str, close_time_str = get_today_schedule(config)  # Get today's schedule / Saage tänane ajakava
-    open_time = datetime.strptime(open_time_str, "%H:%M").time()  # Get opening time / Saage avamisaeg
-    close_time = datetime.strptime(close_time_str, "%H:%M").time()  # Get closing time / Saage sulgemisaeg
-    time_before_opening = config['time_before_opening']
-    time_after_closing = config['time_after_closing']
-    config_check_interval = config['config_check_interval']
-    announcements = get_today_announcements(config)
+    if 'audio_output_device' in config: # Key exists but is empty or whitespace
+        logging.info("Audio output device is empty in config. Attempting auto-detection.")
+    else: # Key does not exist
+        logging.info("Audio output device not configured in config. Attempting auto-detection.")
 
-    # Calculate start and end times based on configuration / Arvutage konfiguratsiooni põhjal algus- ja lõpuaeg
-    start_time = (datetime.combine(datetime.now(), open_time) - timedelta(minutes=time_before_opening)).time()
-    end_time = (datetime.combine(datetime.now(), close_time) + timedelta(minutes=time_after_closing)).time()
+    detected_device = detect_raspberry_pi_audio_device()
+    if detected_device:
+        logging.info(f"Successfully auto-detected audio device: {detected_device}")
+    else:
+        logging.error("Auto-detection of audio device failed. No audio will be played. Please configure 'audio_output_device' in config.toml if you want audio output.")
+    return detected_device
+
+# Config keys grouped by the part of the runtime they affect / Konfiguratsioonivõtmed rühmitatuna
+CONFIG_SECTIONS = {
+    'schedule': ('default_open_time', 'default_close_time', 'time_before_opening', 'time_after_closing', 'weekly_schedule', 'date_exceptions'),
+    'announcements': ('default_announcements', 'announcements', 'announcement_timeout', 'announcement_catch_up'),
+    'device': ('audio_output_device',),
+    'music': ('background_music_folder', 'music_recursive'),
+    'playback': ('gapless_playback', 'crossfade_seconds'),
+    'zones': ('zones', 'volume'),
+    'logging': ('log_retention_days', 'log_retention_mb'),
+    'loudness': ('loudness_normalization', 'loudness_target', 'loudness_workers'),
+    'read_ahead': ('read_ahead_tracks', 'music_cache_folder', 'music_cache_mb'),
+    'diagnostics': ('diagnostics', 'diagnostics_seconds'),
+    'transcode': ('transcode', 'transcode_cache_folder', 'transcode_cache_mb', 'transcode_sample_rate'),
+}
+# Keys of a zone, after merging its [zones.<name>] table over the top level / Tsooni võtmed
+ZONE_SECTIONS = {
+    'device': ('audio_output_device',),
+    'music': ('background_music_folder', 'music_recursive'),
+    'playback': ('gapless_playback', 'crossfade_seconds'),
+    'volume': ('volume', 'duck_volume'),
+    'routing': ('play_announcements',),
+    'playlist': ('playlist_order', 'shuffle_seed', 'artist_separation', 'folder_weights', 'dayparts'),
+}
+ZONE_KEYS = tuple(key for keys in ZONE_SECTIONS.values() for key in keys)
+
+# Function to find which config sections differ / Funktsioon muutunud konfiguratsiooniosade leidmiseks
+def diff_config_sections(old_config, new_config, sections=CONFIG_SECTIONS):
+    changed = set()
+    for section, keys in sections.items():
+        if any(old_config.get(key) != new_config.get(key) for key in keys):
+            changed.add(section)
+    return changed
+
+# Function to get the settings of each zone / Funktsioon iga tsooni seadete saamiseks
+def get_zone_configs(config):
+    # Without [zones] tables the top-level settings form a single zone called "main"
+    zones = config.get('zones') or {'main': {}}
+    zone_configs = {}
+    for name, zone in zones.items():
+        zone_configs[name] = {key: zone[key] if key in zone else config[key]
+                              for key in ZONE_KEYS if key in zone or key in config}
+    return zone_configs
+
+# Function to format an announcement time for the log / Funktsioon teadaande aja vormindamiseks
+def format_slot(slot):
+    return slot.strftime("%H:%M:%S" if slot.second else "%H:%M")
+
+# Function to get the full path of an announcement file / Funktsioon teadaande faili täieliku tee saamiseks
+def get_announcement_path(announcement_file):
+    return os.path.join(WORKING_DIR, announcement_file)
+
+class ConfigWatcher:
+    """
+    Watches the config file with inotify and calls event_callback("config_changed")
+    from a background thread when it is written or replaced. The directory
+    is watched rather than the file, because editors usually save by
+    writing a new file and renaming it over the old one.
 
-    logging.info(f"Initial schedule loaded: start time: {start_time}, end time: {end_time}")
-    logging.info(f"Today's announcements: {announcements}")
+    If inotify is not available, start() returns False and the caller
+    polls changed(), which only compares the file's stat() result.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self, path, event_callback):
+        # Absolute, so a relative --config still gives inotify a directory to watch
+        self.path = os.path.abspath(path)
+        self.event_callback = event_callback
+        self.fd = None
+        self._stop_read, self._stop_write = None, None
+        self.last_stat = self._stat()
+
+    def start(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                error = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(error, "inotify_add_watch failed")
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify not available for {self.path} ({e}), checking the config file with stat() every second instead.")
+            return False
+        self.fd = fd
+        self._stop_read, self._stop_write = os.pipe()
+        threading.Thread(target=self._read_events, name="config-watcher", daemon=True).start()
+        logging.info(f"Watching {self.path} for changes with inotify.")
+        return True
+
+    def _read_events(self):
+        name = os.path.basename(self.path).encode()
+        while True:
+            readable, _, _ = select.select([self.fd, self._stop_read], [], [])
+            if self._stop_read in readable:
+                break
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = struct.unpack_from("iIII", data, offset)
+                entry = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+                offset += 16 + length
+                if entry == name:
+                    self.event_callback("config_changed")
+                    break
+        os.close(self.fd)
+        os.close(self._stop_read)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def changed(self):
+        current = self._stat()
+        if current == self.last_stat:
+            return False
+        self.last_stat = current
+        return True
+
+    def close(self):
+        if self._stop_write is not None:
+            os.write(self._stop_write, b"x")
+            os.close(self._stop_write)
+            self._stop_write = None
+
+class ControlServer:
+    """
+    Local control and status API on a Unix socket. Each request is one line
+    of JSON such as {"command": "status"} or {"command": "announce", "file":
+    "sale.mp3"}, answered with one line of JSON. It is served by the
+    station's asyncio loop, so a command is handled as soon as it arrives,
+    between two events, and never while one is being handled.
+    """
+    def __init__(self, station, path):
+        self.station = station
+        self.path = path
+        self.server = None
 
-    # 1. Start fresh logging
-    enable_memory_logging = config.get('enable_memory_logging', False)
-    log_memory_usage(enable_memory_logging)
+    async def start(self):
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)  # left over from a run that crashed
+            self.server = await asyncio.start_unix_server(self.handle, self.path)
+            os.chmod(self.path, 0o660)
+        except OSError as e:
+            logging.error(f"Could not open control socket {self.path}: {e}")
+            return
+        logging.info(f"Control API listening on {self.path}")
 
-    last_hash = get_file_hash(CONFIG_PATH)
-    last_config_check_minute = -1
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    response = self.station.control(request)
+                except ValueError as e:
+                    response = {'ok': False, 'error': str(e)}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, ValueError):  # ValueError: line over the stream limit
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+class SystemClock:
+    """
+    Time source of the Scheduler and RadioStation. simulate.py swaps it for
+    a simulated clock that jumps straight to the next event.
+    """
+    def now(self):
+        return datetime.now()
 
-    # Initialize RadioPlayer
-    radio_player = RadioPlayer(audio_device)
+    def wait(self, condition, timeout):
+        condition.wait(timeout)
 
-    last_announcement_time = None
-    audio_files = [] # Initialize empty list for audio files
-    file_index = 0
-    current_day = datetime.now().day
+class Scheduler:
+    """
+    Priority queue of timed events for the main loop. The loop sleeps until
+    the next event is due, or until another thread (e.g. a VLC callback)
+    posts an event that has to be handled right away.
 
-    # Determine music folder path
-    music_folder_path_config = config.get('background_music_folder')
-    default_music_folder = os.path.join(WORKING_DIR, "bgmusic")
+    The station runs it on asyncio with next_event_async(), so the control
+    API is served by the same loop; the simulator uses the blocking
+    next_event() with its simulated clock.
+    """
+    # Upper bound for a single sleep. The Pi has no RTC and NTP may move the
+    # wall clock after boot, so long sleeps are re-checked against it.
+    MAX_SLEEP = 300
+
+    def __init__(self, metrics=None, clock=None):
+        self.metrics = metrics or Metrics()
+        self.clock = clock or SystemClock()
+        self._queue = []  # heap of (when, sequence, kind, payload)
+        self._sequence = itertools.count()
+        self._posted = deque()
+        self._condition = threading.Condition()
+        self._loop = None  # asyncio loop of next_event_async()
+        self._loop_thread = None
+        self._wakeup = None
+        self.wakeups = 0
+
+    def schedule(self, when, kind, payload=None):
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), kind, payload))
+            self._condition.notify()
+        self._wake_loop()
+
+    def post(self, kind, payload=None):
+        # Safe to call from any thread / Ohutu kutsuda mis tahes lõimest
+        with self._condition:
+            self._posted.append((kind, payload))
+            self._condition.notify()
+        self._wake_loop()
+
+    def _wake_loop(self):
+        if self._loop is None:
+            return
+        if threading.get_ident() == self._loop_thread:
+            self._wakeup.set()  # e.g. a control command scheduled something while the loop waits
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:  # The loop has already been closed
+            pass
+
+    def upcoming(self, count):
+        # The next timed events as (when, kind), for the control API
+        with self._condition:
+            return [(when, kind) for when, _, kind, _ in heapq.nsmallest(count, self._queue)]
+
+    def cancel(self, *kinds):
+        with self._condition:
+            self._queue = [entry for entry in self._queue if entry[2] not in kinds]
+            heapq.heapify(self._queue)
+
+    def _pop_due(self):
+        # Returns (event, None) when an event is due, otherwise (None, seconds to sleep)
+        with self._condition:
+            if self._posted:
+                return self._posted.popleft(), None
+            now = self.clock.now()
+            if self._queue and self._queue[0][0] <= now:
+                when, _, kind, payload = heapq.heappop(self._queue)
+                self.metrics.observe('wakeup_latency_seconds', (now - when).total_seconds())
+                return (kind, payload), None
+            timeout = self.MAX_SLEEP
+            if self._queue:
+                timeout = min(timeout, (self._queue[0][0] - now).total_seconds())
+            return None, timeout
+
+    def next_event(self):
+        with self._condition:
+            while True:
+                event, timeout = self._pop_due()
+                if event:
+                    return event
+                self.clock.wait(self._condition, timeout)
+                self.wakeups += 1
+                self.metrics.increment('wakeups_total')
+
+    async def next_event_async(self):
+        if self._loop is None:
+            self._wakeup = asyncio.Event()
+            self._loop_thread = threading.get_ident()
+            self._loop = asyncio.get_running_loop()
+        while True:
+            # Cleared before looking, so an event posted meanwhile still wakes the wait below
+            self._wakeup.clear()
+            event, timeout = self._pop_due()
+            if event:
+                return event
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeups += 1
+            self.metrics.increment('wakeups_total')
+
+# Function to read the playback checkpoint / Funktsioon taasesituse kontrollpunkti lugemiseks
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    if music_folder_path_config and os.path.isdir(music_folder_path_config):
-        audio_files = load_audio_files(music_folder_path_config)
-    elif os.path.isdir(default_music_folder):
-        logging.info(f"No valid 'background_music_folder' in config, using default: {default_music_folder}")
-        audio_files = load_audio_files(default_music_folder)
-    else:
-        logging.warning("No background music folder specified in config and default 'bgmusic' folder not found. No background music will be played.")
+# Function to write the playback checkpoint atomically / Funktsioon kontrollpunkti kirjutamiseks
+def save_checkpoint(state, path):
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+            # On disk before the rename, so a power cut leaves the old file or the new one, never an empty one
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not write playback checkpoint: {e}")
+
+class Zone:
+    """
+    One output of the station: a RadioPlayer on its own audio device, with
+    its own playlist position, volume and announcement routing. Zones share
+    the station's scheduler, config, compiled schedule and library index.
+    Events from the zone's player carry the zone name as payload[0].
+    """
+    # Extra time allowed past an announcement's known duration before it is stopped
+    ANNOUNCEMENT_GRACE = 10
+    # Volume ramp resolution while crossfading between tracks
+    CROSSFADE_STEP_MS = 100
+    # Minimum seconds between two VLC recycles of a zone
+    RECYCLE_MIN_INTERVAL = 60 * 60
+    # Limits of the loudness correction, in dB
+    MAX_GAIN_BOOST = 6
+    MAX_GAIN_CUT = 20
+
+    def __init__(self, station, name, config, shared_instance=False, resume=None):
+        self.station = station
+        self.name = name
+        self.config = config
+        self.log_prefix = f"Zone {name}: " if shared_instance else ""
+        self.audio_device = get_audio_device_from_config(config)
+        self.radio_player = station.player_factory(
+            self.audio_device, event_callback=lambda kind: station.scheduler.post(kind, (name,)),
+            metrics=station.metrics, shared_instance=shared_instance)
+        self.radio_player.set_volume(self.volume)
+        self.audio_files = []
+        self.file_index = 0
+        self.resume_seconds = 0  # position to start the first track at after a restart
+        self.music_active = False
+        self.announcement_queue = deque()  # announcements waiting for the current one to finish
+        self.current_announcement = None  # token of the playing announcement
+        self.current_announcement_slot = None
+        self.current_announcement_file = None
+        self.announcement_tokens = itertools.count(1)
+        self.announcement_files = []  # today's announcements, preloaded again after wake()
+        self.asleep = False
+        self.paused = False  # music paused through the control API
+        self.preloaded = None  # source path of the track on the standby player
+        self.player_opened = station.clock.now()
+        self.last_recycle = None
+        self.apply_playback_settings()
+        # Only a track that was playing is resumed; otherwise the playlist picks the first one
+        playing = resume and resume.get('playing', True)
+        self.use_playlist(station.playlist_for(config), playing and resume.get('track'))
+        if playing and not self.pick_next:
+            self.resume_seconds = resume.get('position', 0)
+
+    def checkpoint(self):
+        return {'track': self.audio_files[self.file_index] if self.audio_files else None,
+                'position': self.radio_player.current_position() if self.music_active else 0,
+                'playing': self.music_active}
+
+    def unfinished_announcements(self):
+        # Slots of announcements that were queued or cut short
+        slots = {slot for slot, _, manual in self.announcement_queue if not manual}
+        if self.current_announcement_slot:
+            slots.add(self.current_announcement_slot)
+        return slots
+
+    @property
+    def volume(self):
+        return self.config.get('volume', 100)
+
+    @property
+    def duck_volume(self):
+        # Music volume during announcements, in percent of the zone volume
+        return self.volume * self.config.get('duck_volume', 20) // 100
+
+    def track_gain(self, file_path):
+        # Volume factor that brings the track to loudness_target, 1.0 until it has been analyzed
+        if not self.station.config.get('loudness_normalization', True):
+            return 1.0
+        track = self.station.library.get_track(file_path)
+        if not track or track['loudness'] is None:
+            return 1.0
+        gain_db = self.station.config.get('loudness_target', -18) - track['loudness']
+        gain_db = max(-self.MAX_GAIN_CUT, min(self.MAX_GAIN_BOOST, gain_db))
+        return 10 ** (gain_db / 20)
+
+    def routes(self, announcement_file):
+        # play_announcements: true (all, the default), false (none) or a list of file names
+        routing = self.config.get('play_announcements', True)
+        if isinstance(routing, bool):
+            return routing
+        return announcement_file in routing
+
+    def close(self):
+        self.radio_player.release()
+
+    def preload_announcements(self, file_paths):
+        self.announcement_files = file_paths
+        if not self.asleep:
+            self.radio_player.preload_announcements(file_paths)
+
+    def sleep(self):
+        # Closed hours: give the VLC instance, its memory and the ALSA device back / Suletud ajal vabastatakse VLC
+        if not self.asleep:
+            logging.info(f"{self.log_prefix}Releasing VLC until the next opening.")
+            self.radio_player.release()
+            self.asleep = True
+
+    def wake(self):
+        if self.asleep:
+            logging.info(f"{self.log_prefix}Starting VLC.")
+            self.radio_player.reopen()
+            self.radio_player.set_volume(self.volume)
+            self.radio_player.preload_announcements(self.announcement_files)
+            self.asleep = False
+            self.player_opened = self.station.clock.now()
+
+    def warm_up(self):
+        # Opens VLC and buffers the first track shortly before the music starts
+        self.wake()
+        if self.audio_files and not self.music_active:
+            self.pick_first_track()
+            self.preload(self.audio_files[self.file_index])
+
+    def pick_first_track(self):
+        # At the start of the music window the playlist (shuffle, dayparts) chooses what plays first
+        if self.pick_next:
+            self.file_index = self.playlist.advance()
+            self.pick_next = False
+
+    def needs_recycle(self):
+        # Long-running VLC instances grow; recreate them when RSS or age is over the limit
+        now = self.station.clock.now()
+        if self.last_recycle and (now - self.last_recycle).total_seconds() < self.RECYCLE_MIN_INTERVAL:
+            return False
+        if self.current_announcement is not None:
+            return False
+        limit_mb = self.station.config.get('rss_recycle_mb', 200)
+        if limit_mb and get_current_rss_kb() > limit_mb * 1024:
+            return True
+        return (now - self.player_opened).total_seconds() > RESTART_INTERVAL
+
+    def recycle(self):
+        logging.info(f"{self.log_prefix}Recycling VLC (RSS {get_current_rss_kb()} KB).")
+        self.last_recycle = self.station.clock.now()
+        self.radio_player.release()
+        self.asleep = True
+        self.wake()
+
+    def apply_config(self, config):
+        # Applies this zone's part of a reloaded config and returns the changed sections
+        changed = diff_config_sections(self.config, config, ZONE_SECTIONS)
+        self.config = config
+        if 'device' in changed:
+            if self.reload_device():
+                self.music_active = False  # update_device() stopped playback
+                if self.current_announcement is not None:
+                    self.finish_announcement()
+            else:
+                changed.discard('device')
+        if 'playback' in changed:
+            self.apply_playback_settings()
+        if 'music' in changed:
+            self.reload_music()
+        elif 'playlist' in changed:
+            self.use_playlist(self.audio_files, self.audio_files[self.file_index] if self.audio_files else None)
+        if 'volume' in changed and self.current_announcement is None:
+            self.radio_player.set_volume(self.volume)
+        return changed
+
+    def apply_playback_settings(self):
+        self.gapless_playback = self.config.get('gapless_playback', False)
+        crossfade_seconds = self.config.get('crossfade_seconds', 0) if self.gapless_playback else 0
+        self.radio_player.crossfade_ms = int(crossfade_seconds * 1000)
+
+    def use_playlist(self, audio_files, current_file=None):
+        # Keep playing from current_file if it is still in the list
+        self.audio_files = audio_files
+        try:
+            self.file_index = audio_files.index(current_file)
+            self.pick_next = False
+        except ValueError:
+            self.file_index = 0
+            self.pick_next = True  # the next start asks the playlist
+        self.playlist = Playlist(audio_files, self.config, self.station.clock, None if self.pick_next else self.file_index,
+                                 self.station.music_folder_for(self.config))
+
+    def next_file_index(self):
+        return self.playlist.peek()
+
+    def resolve(self, file_path):
+        # Transcoded rendition, else the local copy from the read-ahead cache when there is one
+        if self.station.transcoder:
+            rendition = self.station.transcoder.resolve(file_path)
+            if rendition:
+                return rendition
+        cache = self.station.read_ahead
+        if cache is None:
+            return file_path
+        local_path = cache.resolve(file_path)
+        if local_path is None and cache.offline:
+            local_path = cache.offline_track()
+            if local_path:
+                logging.info(f"{self.log_prefix}{file_path} is not cached, playing {local_path} instead.")
+        return local_path or file_path
+
+    def preload(self, file_path):
+        self.radio_player.preload_next(self.resolve(file_path), gain=self.track_gain(file_path))
+        self.preloaded = file_path if self.radio_player.standby_path else None
+
+    def is_preloaded(self, file_path):
+        return self.radio_player.standby_path is not None and self.preloaded == file_path
+
+    def start_music(self):
+        self.wake()
+        self.pick_first_track()
+        start_seconds, self.resume_seconds = self.resume_seconds, 0
+        # The first track may have been buffered by warm_up()
+        if not start_seconds and self.is_preloaded(self.audio_files[self.file_index]) and self.radio_player.swap_to_standby():
+            self.preload_upcoming()
+            return
+        # Skip files that cannot be opened, but try each one only once
+        for _ in range(len(self.audio_files)):
+            file_path = self.audio_files[self.file_index]
+            if self.radio_player.play_file(self.resolve(file_path), start_seconds=start_seconds, gain=self.track_gain(file_path)):
+                self.preload_upcoming()
+                log_memory_usage(self.station.enable_memory_logging)
+                return
+            start_seconds = 0
+            self.file_index = self.playlist.advance()
+
+    def preload_upcoming(self):
+        if self.gapless_playback and self.music_active:
+            self.preload(self.audio_files[self.next_file_index()])
+        if self.station.read_ahead and self.music_active:
+            count = self.station.config.get('read_ahead_tracks', 0)
+            self.station.read_ahead.prefetch(self.audio_files[index] for index in self.playlist.lookahead(count))
+
+    def record_duration(self):
+        # The library learns track durations from VLC as tracks are played
+        length = self.radio_player.current_length()
+        track = self.station.library.get_track(self.audio_files[self.file_index])
+        if length > 0 and track and track['duration'] is None:
+            self.station.library.set_duration(self.audio_files[self.file_index], length / 1000)
+
+    def advance(self):
+        # Moves to the next track, using the preloaded one when it is ready
+        self.file_index = self.playlist.advance()
+        if self.needs_recycle():
+            # Between two tracks is the quietest moment to recreate VLC
+            self.recycle()
+            self.start_music()
+        elif self.is_preloaded(self.audio_files[self.file_index]) and self.radio_player.swap_to_standby():
+            self.preload_upcoming()
+            log_memory_usage(self.station.enable_memory_logging)
+        else:
+            self.start_music()
+
+    def update_music_window(self, is_open):
+        active = bool(self.audio_files) and is_open
+        if active and not self.music_active:
+            logging.info(f"{self.log_prefix}Within time window, starting playback.")
+            self.music_active = True
+            self.start_music()
+        elif not active and self.music_active:
+            self.music_active = False
+            self.pick_next = True  # the next opening starts with a new pick, not the interrupted track
+            self.radio_player.stop()
+            # Logged in every end of day when script stops playing.
+            log_memory_usage(self.station.enable_memory_logging)
+
+    def on_track_end(self):
+        if not self.music_active:
+            return
+        logging.info(f"{self.log_prefix}Finished playing {self.audio_files[self.file_index]}.")
+        self.record_duration()
+        self.advance()
 
-    while True:
-        now = get_current_time()  # Get the current time / Saage praegune aeg
-        now_str = now.strftime("%H:%M")
-        new_day = datetime.now().day
-        
-        # Create a new log file if the day has changed
-        if new_day != current_day:
-            setup_logging()
-            current_day = new_day
-            logging.info(f"Day changed. Log file updated to: {LOG_FILE}")
-
-        # Check for announcements / Kontrollige teadaandeid
-        if now_str in announcements:
-            announcement_file = announcements[now_str]
-            if last_announcement_time != now_str:
-                logging.info(f"Playing announcement: {announcement_file} at {now_str}")
-
-                radio_player.set_volume(20)  # Reduce background music volume / Vähendage taustamuusika helitugevust
-
-                # Ensure full path is used for announcements
-                announcement_path = os.path.join(WORKING_DIR, announcement_file)
-                radio_player.play_announcement(announcement_path)
-
-                radio_player.set_volume(100)  # Restore background music volume / Taastage taustamuusika helitugevus
-
-                last_announcement_time = now_str
-
-        # Play background music / Mängige taustamuusikat
-        if audio_files: # Only attempt to play if there are audio files loaded
-            if is_time_between(start_time, end_time):
-                state = radio_player.get_state()
-                if state == vlc.State.Ended:
-                    logging.info(f"Finished playing {audio_files[file_index]}.")
-                    file_index = (file_index + 1) % len(audio_files)
-                    radio_player.play_file(audio_files[file_index])
-                    # 2. Logged after every audio file switch.
-                    log_memory_usage(enable_memory_logging)
-                elif state == vlc.State.NothingSpecial or state == vlc.State.Stopped:
-                    logging.info("Within time window, starting playback.")
-                    radio_player.play_file(audio_files[file_index])
-                    # 2. Logged after every audio file switch (initial start).
-                    log_memory_usage(enable_memory_logging)
+    def on_track_error(self):
+        if not self.music_active:
+            return
+        logging.error(f"{self.log_prefix}VLC could not play {self.audio_files[self.file_index]}, skipping it.")
+        self.advance()
+
+    def on_track_crossfade(self):
+        if not self.music_active or not self.is_preloaded(self.audio_files[self.next_file_index()]):
+            return  # The track ends normally and on_track_end() takes over
+        logging.info(f"{self.log_prefix}Crossfading out of {self.audio_files[self.file_index]}.")
+        self.record_duration()
+        self.file_index = self.playlist.advance()
+        self.radio_player.begin_crossfade()
+        self.on_crossfade_step(0, max(1, self.radio_player.crossfade_ms // self.CROSSFADE_STEP_MS))
+
+    def on_crossfade_step(self, step, steps):
+        if step < steps:
+            self.radio_player.crossfade_step(step / steps)
+            step_time = self.station.clock.now() + timedelta(milliseconds=self.CROSSFADE_STEP_MS)
+            self.station.scheduler.schedule(step_time, "crossfade_step", (self.name, step + 1, steps))
+            return
+        self.radio_player.end_crossfade()
+        self.preload_upcoming()
+        log_memory_usage(self.station.enable_memory_logging)
+
+    def skip(self):
+        # Returns False when there is no track to skip, or it is already fading out
+        if not self.music_active or self.radio_player.fading_player:
+            return False
+        logging.info(f"{self.log_prefix}Skipping {self.audio_files[self.file_index]}.")
+        self.advance()
+        return True
+
+    def status(self):
+        return {'device': self.audio_device,
+                'volume': self.volume,
+                'playing': self.music_active,
+                'track': self.audio_files[self.file_index] if self.music_active else None,
+                'position': round(self.radio_player.current_position(), 1) if self.music_active else None,
+                'announcement': self.current_announcement_file,
+                'queued_announcements': [f for _, f, _ in self.announcement_queue],
+                'paused': self.paused,
+                'vlc_released': self.asleep}
+
+    def queue_announcement(self, slot, announcement_file, manual=False):
+        # Manual announcements (control API) are played however long they wait behind others
+        self.wake()
+        self.announcement_queue.append((slot, announcement_file, manual))
+        if self.current_announcement is None:
+            self.start_next_announcement()
+
+    def start_next_announcement(self):
+        while self.announcement_queue:
+            slot, announcement_file, manual = self.announcement_queue.popleft()
+            # An announcement that waited too long, behind others or a stalled loop, is dropped rather than played late
+            lateness = (self.station.clock.now() - slot).total_seconds()
+            if lateness > self.station.announcement_catch_up and not manual:
+                logging.warning(f"{self.log_prefix}Dropping announcement {announcement_file} of {format_slot(slot)}: "
+                                f"{lateness:.1f} s late, announcement_catch_up is {self.station.announcement_catch_up} s.")
+                self.station.metrics.increment('announcements_dropped_total')
+                continue
+            # Reduce background music volume / Vähendage taustamuusika helitugevust
+            self.radio_player.set_volume(self.duck_volume)
+
+            duration = self.radio_player.play_announcement(get_announcement_path(announcement_file))
+            if duration is False:
+                continue
+            now = self.station.clock.now()
+            lateness = (now - slot).total_seconds()
+            if not manual:
+                self.station.metrics.observe('announcement_lateness_seconds', lateness)
+            logging.info(f"{self.log_prefix}Announcement {announcement_file} of {format_slot(slot)} started {lateness * 1000:.0f} ms late.")
+
+            self.current_announcement = next(self.announcement_tokens)
+            self.current_announcement_slot = None if manual else slot
+            self.current_announcement_file = announcement_file
+            if duration:
+                timeout = duration + self.ANNOUNCEMENT_GRACE
             else:
-                state = radio_player.get_state()
-                if state != vlc.State.Stopped and state != vlc.State.NothingSpecial:
-                     radio_player.stop()
-                     # 3. Logged in every end of day when script stops playing.
-                     log_memory_usage(enable_memory_logging)
-        else: # No audio files loaded
-            state = radio_player.get_state()
-            if state != vlc.State.Stopped and state != vlc.State.NothingSpecial:
-                 radio_player.stop()
-                 # 3. Logged in every end of day when script stops playing.
-                 log_memory_usage(enable_memory_logging)
-
-        # Check if the configuration file content has changed at specified intervals / Kontrollige, kas konfiguratsioonifaili sisu on muutunud määratud intervallidega
-        current_minute = datetime.now().minute
-        if (datetime.now() - timedelta(minutes=config_check_interval)).minute % config_check_interval == 0 and current_minute != last_config_check_minute:
-            last_config_check_minute = current_minute
-            current_hash = get_file_hash(CONFIG_PATH)
-
-            if current_hash != last_hash:
-                config = load_config(CONFIG_PATH)  # Load the updated configuration file / Laadige uuendatud konfiguratsioonifail
-                if config is None:
-                    logging.error("Failed to load updated configuration. Exiting.")
+                timeout = self.station.config.get('announcement_timeout', 300)
+            self.station.scheduler.schedule(now + timedelta(seconds=timeout), "announcement_timeout",
+                                            (self.name, self.current_announcement))
+            return
+
+        self.radio_player.set_volume(self.volume)  # Restore background music volume / Taastage taustamuusika helitugevus
+        if not self.music_active and self.station.closed:
+            self.sleep()
+
+    def finish_announcement(self):
+        self.current_announcement = None
+        self.current_announcement_slot = None
+        self.current_announcement_file = None
+        self.radio_player.stop_announcement()
+        self.start_next_announcement()
+
+    def on_announcement_end(self):
+        if self.current_announcement is not None:
+            self.finish_announcement()
+
+    def on_announcement_error(self):
+        if self.current_announcement is not None:
+            logging.error(f"{self.log_prefix}VLC could not play the announcement.")
+            self.finish_announcement()
+
+    def on_announcement_timeout(self, token):
+        # Timeouts of announcements that already ended are ignored
+        if token == self.current_announcement:
+            logging.warning(f"{self.log_prefix}Announcement did not finish in time, stopping it.")
+            self.finish_announcement()
+
+    def reload_music(self):
+        # Keep playing from the current track if it is still in the library
+        current_file = self.audio_files[self.file_index] if self.audio_files else None
+        self.use_playlist(self.station.playlist_for(self.config), current_file)
+
+    def reload_device(self):
+        # Check for audio device change
+        audio_device_from_config = self.config.get('audio_output_device')
+        new_audio_device = self.audio_device
+
+        if audio_device_from_config and audio_device_from_config.strip():
+            new_audio_device = audio_device_from_config.strip()
+        elif 'audio_output_device' in self.config and not self.config['audio_output_device']:
+            # Empty value in config means auto-detect
+            detected = detect_raspberry_pi_audio_device()
+            if detected:
+                new_audio_device = detected
+
+        if self.asleep:
+            # VLC is released for the night; wake() opens the new device / wake() avab uue seadme
+            if new_audio_device == self.radio_player.audio_device_name:
+                return False
+            logging.info(f"{self.log_prefix}Audio device changed from {self.radio_player.audio_device_name} to {new_audio_device}, used from the next opening.")
+            self.radio_player.audio_device_name = self.audio_device = new_audio_device
+            return True
+
+        # Update device in player
+        if self.radio_player.update_device(new_audio_device):
+            self.audio_device = new_audio_device
+            return True
+        return False
+
+class RadioStation:
+    """
+    Drives the zones' players from one Scheduler. Today's timeline (music
+    window, announcements, midnight rollover, config checks) is built once
+    and the loop only wakes up when one of those events is due or when VLC
+    reports the end of a track.
+    """
+    # Timeline events rebuilt on day change and config reload / Ajajoone sündmused
+    TIMELINE_EVENTS = ("music_window", "warm_up", "announcement", "day_change")
+    # Events handled by a zone; their payload starts with the zone name
+    ZONE_EVENTS = ("track_end", "track_error", "track_crossfade", "crossfade_step",
+                   "announcement_end", "announcement_error", "announcement_timeout")
+    # Requests of the control API, handled by command_<name>()
+    CONTROL_COMMANDS = ("status", "skip", "announce", "pause", "resume", "reload")
+    # Delay before reloading after a change notification; editors often write the file in several steps
+    CONFIG_SETTLE_MS = 250
+    # A checkpoint older than this resumes the saved track from its start
+    RESUME_MAX_AGE = 10 * 60
+
+    def __init__(self, config, clock=None, player_factory=RadioPlayer, library=None, config_path=CONFIG_PATH,
+                 checkpoint_path=STATE_FILE, schedule_cache=SCHEDULE_CACHE, watch_config=True):
+        self.config = config
+        self.config_path = config_path
+        self.clock = clock or SystemClock()
+        self.metrics = Metrics()
+        self.scheduler = Scheduler(self.metrics, self.clock)
+        self.player_factory = player_factory
+        self.library = library or LibraryIndex()
+        self.enable_memory_logging = config.get('enable_memory_logging', False)
+        self.fired_announcements = set()  # datetimes of announcement slots already played
+        self.last_hash = get_file_hash(config_path)
+        self.schedule_cache = schedule_cache
+        self.schedule = CompiledSchedule.load_or_compile(config, self.last_hash, schedule_cache)
+        self.config_watcher = ConfigWatcher(config_path, self.scheduler.post)
+        self.watch_config = watch_config  # off in the simulator, which relies on the periodic config check
+        self.config_reload_pending = False
+        self.closed = False  # outside the music window; zones release VLC
+        self.diagnostics = Diagnostics(self)
+        configure_log_retention(config)
+        self.read_ahead = self.make_read_ahead_cache(config)
+        self.analyzer = LoudnessAnalyzer(self.library, self.scheduler.post, config.get('loudness_workers', 1))
+        self.transcoder = self.make_transcoder(config)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_changes = None  # tracks and announcements of the last checkpoint written
+        resume = self.restore_checkpoint()
+        self.zones = {}
+        self._playlists = {}
+        zone_configs = get_zone_configs(config)
+        for name, zone_config in zone_configs.items():
+            self.zones[name] = Zone(self, name, zone_config, shared_instance=len(zone_configs) > 1,
+                                    resume=resume.get(name))
+
+    def make_read_ahead_cache(self, config):
+        if config.get('read_ahead_tracks', 0) <= 0:
+            return None
+        folder = os.path.expanduser(config.get('music_cache_folder') or os.path.join(WORKING_DIR, "music_cache"))
+        return ReadAheadCache(self.library, folder, config.get('music_cache_mb', 2048))
+
+    def make_transcoder(self, config):
+        if not config.get('transcode', True):
+            return None
+        folder = os.path.expanduser(config.get('transcode_cache_folder') or os.path.join(WORKING_DIR, "transcoded"))
+        return Transcoder(self.library, self.scheduler.post, folder, config.get('transcode_cache_mb', 4096),
+                          config.get('transcode_sample_rate', 48000), config.get('loudness_workers', 1))
+
+    def restore_checkpoint(self):
+        # Picks up where a crashed or restarted run left off / Jätkab sealt, kus eelmine käivitus pooleli jäi
+        if not self.checkpoint_path:
+            return {}
+        state = load_checkpoint(self.checkpoint_path)
+        try:
+            saved = datetime.fromisoformat(state['saved'])
+            zones = state['zones']
+            fired = {datetime.fromisoformat(slot) for slot in state['fired_announcements']}
+        except (KeyError, TypeError, ValueError):
+            return {}
+        now = self.clock.now()
+        self.fired_announcements = {slot for slot in fired if slot.date() == now.date()}
+        elapsed = (now - saved).total_seconds()
+        for zone_state in zones.values():
+            if not 0 <= elapsed <= self.RESUME_MAX_AGE:
+                zone_state['position'] = 0
+            elif zone_state.get('playing'):
+                # Checkpoints are only written on changes, so the track kept playing after the last one
+                zone_state['position'] = zone_state.get('position', 0) + elapsed
+        logging.info(f"Resuming from checkpoint saved at {saved}: {zones}")
+        return zones
+
+    def on_checkpoint(self, payload):
+        interval = self.config.get('checkpoint_interval', 60)
+        if self.checkpoint_path and interval > 0 and not self.closed:
+            self.save_checkpoint(force=False)
+            self.scheduler.schedule(self.clock.now() + timedelta(seconds=interval), "checkpoint")
+
+    def save_checkpoint(self, force=True):
+        # Announcements that did not finish are left out, so they are played again if still due
+        unfinished = set().union(*(zone.unfinished_announcements() for zone in self.zones.values()))
+        state = {
+            'fired_announcements': sorted(slot.isoformat() for slot in self.fired_announcements - unfinished),
+            'zones': {name: zone.checkpoint() for name, zone in self.zones.items()},
+        }
+        # The SD card is only written when a track or an announcement changed, not for the position alone
+        changes = (state['fired_announcements'],
+                   sorted((name, zone['track'], zone['playing']) for name, zone in state['zones'].items()))
+        if not force and changes == self.checkpoint_changes:
+            return
+        self.checkpoint_changes = changes
+        state['saved'] = self.clock.now().isoformat()
+        save_checkpoint(state, self.checkpoint_path)
+
+    def playlist_for(self, zone_config):
+        # Zones playing the same folder share one playlist list / Sama kausta mängivad tsoonid jagavad esitusloendit
+        key = (zone_config.get('background_music_folder'), zone_config.get('music_recursive', True))
+        if key not in self._playlists:
+            self._playlists[key] = load_music_from_config(zone_config, self.library, self.read_ahead is not None)
+        return self._playlists[key]
+
+    def music_folder_for(self, zone_config):
+        # With read-ahead, a configured share counts even while it is not mounted
+        return get_music_folder(zone_config, self.read_ahead is not None)
+
+    def start(self):
+        log_memory_usage(self.enable_memory_logging)
+        self.build_timeline()
+        self.schedule_config_check()
+        if self.watch_config and not self.config_watcher.start():
+            self.scheduler.schedule(self.clock.now() + timedelta(seconds=1), "config_poll")
+        if self.config.get('metrics_http_port'):
+            self.metrics.serve_http(self.config['metrics_http_port'])
+        self.on_metrics_export(None)
+        self.on_checkpoint(None)
+        if self.config.get('diagnostics', False):
+            self.diagnostics.start_capture()
+
+    def run(self, until=None):
+        # Blocking main loop of the simulator / Simulaatori põhitsükkel
+        self.start()
+        while until is None or self.clock.now() < until:
+            kind, payload = self.scheduler.next_event()
+            if self.dispatch(kind, payload) is False:
+                return
+
+    async def serve(self):
+        # Main loop of the live station, with the control API on the same asyncio loop / Põhitsükkel
+        loop = asyncio.get_running_loop()
+        self.diagnostics.install(loop)
+        self.start()
+        control = None
+        socket_path = self.config.get('control_socket', CONTROL_SOCKET)
+        if socket_path:
+            control = ControlServer(self, os.path.expanduser(socket_path))
+            await control.start()
+        try:
+            while True:
+                kind, payload = await self.scheduler.next_event_async()
+                if self.dispatch(kind, payload) is False:
                     return
+        finally:
+            if control:
+                control.close()
+            self.diagnostics.uninstall(loop)
+
+    def dispatch(self, kind, payload):
+        if kind in self.ZONE_EVENTS:
+            zone = self.zones.get(payload[0])
+            if zone:  # The zone may have been removed by a config reload
+                getattr(zone, f"on_{kind}")(*payload[1:])
+            return None
+        return getattr(self, f"on_{kind}")(payload)
+
+    def close(self):
+        if self.checkpoint_path:
+            self.save_checkpoint()
+        self.analyzer.stop()
+        if self.transcoder:
+            self.transcoder.stop()
+        if self.read_ahead:
+            self.read_ahead.close()
+        self.config_watcher.close()
+        self.metrics.close()
+        for zone in self.zones.values():
+            zone.close()
+        self.library.close()
+
+    def control(self, request):
+        # Handles one control API request / Juhtimisliidese päring
+        command = request.get('command')
+        if command not in self.CONTROL_COMMANDS:
+            raise ValueError(f"unknown command {command!r}, expected one of: {', '.join(self.CONTROL_COMMANDS)}")
+        zones = self.zones
+        if request.get('zone') is not None:
+            if request['zone'] not in self.zones:
+                raise ValueError(f"unknown zone {request['zone']!r}")
+            zones = {request['zone']: self.zones[request['zone']]}
+        if command != "status":  # monitoring polls status; only changes are logged
+            logging.info(f"Control command: {command}")
+        response = getattr(self, f"command_{command}")(request, zones)
+        response.setdefault('ok', True)
+        return response
+
+    def command_status(self, request, zones):
+        totals = self.metrics.totals()
+        return {
+            'time': self.clock.now().isoformat(timespec='seconds'),
+            'open': not self.closed,
+            'paused': all(zone.paused for zone in zones.values()),
+            'zones': {name: zone.status() for name, zone in zones.items()},
+            'next_events': [{'time': when.isoformat(timespec='seconds'), 'event': kind}
+                            for when, kind in self.scheduler.upcoming(10)],
+            'health': {
+                'uptime_seconds': round(time.time() - self.metrics.started),
+                'rss_kb': get_current_rss_kb(),
+                'tracks_played': totals['tracks_played_total'],
+                'announcements_played': totals['announcements_played_total'],
+                'vlc_errors': totals['vlc_errors_total'],
+                'zones_without_device': sorted(name for name, zone in self.zones.items() if not zone.audio_device),
+            },
+        }
+
+    def command_skip(self, request, zones):
+        skipped = [name for name, zone in zones.items() if zone.skip()]
+        return {'ok': bool(skipped), 'skipped': skipped}
+
+    def command_announce(self, request, zones):
+        # Plays an announcement now, in the given zone or in every zone it is routed to
+        announcement_file = request.get('file')
+        if not isinstance(announcement_file, str) or not os.path.isfile(get_announcement_path(announcement_file)):
+            raise ValueError(f"announcement file not found: {announcement_file!r}")
+        if request.get('zone') is None:
+            zones = {name: zone for name, zone in zones.items() if zone.routes(announcement_file)}
+        now = self.clock.now()
+        for zone in zones.values():
+            zone.queue_announcement(now, announcement_file, manual=True)
+        return {'zones': sorted(zones)}
+
+    def command_pause(self, request, zones):
+        for zone in zones.values():
+            zone.paused = True
+        self.on_music_window(None)
+        return {}
+
+    def command_resume(self, request, zones):
+        for zone in zones.values():
+            zone.paused = False
+        self.on_music_window(None)
+        return {}
+
+    def command_reload(self, request, zones):
+        previous_hash = self.last_hash
+        self.reload_config_if_changed()
+        return {'changed': self.last_hash != previous_hash}
+
+    def on_metrics_export(self, payload):
+        interval = self.config.get('metrics_interval', 0)
+        if interval > 0:
+            self.metrics.write_file(self.config.get('metrics_file'))
+            # While closed the figures barely move: one write at closing, the next when the music starts
+            if not self.closed:
+                self.scheduler.schedule(self.clock.now() + timedelta(seconds=interval), "metrics_export")
+
+    def build_timeline(self):
+        self.scheduler.cancel(*self.TIMELINE_EVENTS)
+        now = self.clock.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Yesterday's window may still be open if it spans midnight, and
+        # tomorrow's may start before midnight
+        for day in (today - timedelta(days=1), today, today + timedelta(days=1)):
+            window = self.schedule.window_for(day)
+            for edge in window or ():
+                if edge > now:
+                    self.scheduler.schedule(edge, "music_window")
+            if window and window[0] > now:
+                warm_up = window[0] - timedelta(seconds=self.config.get('warm_up_seconds', 60))
+                self.scheduler.schedule(max(warm_up, now), "warm_up")
+
+        announcements = self.schedule.announcements_for(today)
+        for zone in self.zones.values():
+            zone.preload_announcements([get_announcement_path(f) for _, f in announcements if zone.routes(f)])
+        self.fired_announcements = {slot for slot in self.fired_announcements if slot >= today}
+        catch_up = timedelta(seconds=self.announcement_catch_up)
+        for slot, announcement_file in announcements:
+            # An announcement missed while the script was not running is still played within announcement_catch_up
+            if slot + catch_up > now and slot not in self.fired_announcements:
+                self.scheduler.schedule(max(slot, now), "announcement", (slot, announcement_file))
+
+        self.scheduler.schedule(today + timedelta(days=1), "day_change")
+
+        window = self.schedule.window_for(today)
+        if window:
+            logging.info(f"Schedule loaded: start time: {window[0].time()}, end time: {window[1].time()}")
+        else:
+            logging.info("Schedule loaded: no music today.")
+        logging.info(f"Today's announcements: {[(format_slot(slot), f) for slot, f in announcements]}")
+        self.on_music_window(None)
+
+    def schedule_config_check(self):
+        interval = self.config['config_check_interval']
+        self.scheduler.schedule(self.clock.now() + timedelta(minutes=interval), "config_check")
+
+    def on_music_window(self, payload):
+        is_open = self.schedule.is_open(self.clock.now())
+        was_closed, self.closed = self.closed, not is_open
+        for zone in self.zones.values():
+            zone.update_music_window(is_open and not zone.paused)
+            if self.closed and zone.current_announcement is None:
+                zone.sleep()
+        # Playback state does not change while closed, so checkpoints pause until the music starts
+        if self.closed and not was_closed and self.checkpoint_path:
+            self.save_checkpoint()
+        elif was_closed and not self.closed:
+            self.scheduler.cancel("checkpoint")
+            self.on_checkpoint(None)
+        # Metrics exports pause the same way / Mõõdikute kirjutamine peatub samamoodi
+        if self.closed != was_closed:
+            self.scheduler.cancel("metrics_export")
+            self.on_metrics_export(None)
+        # New tracks are analyzed only while the music is off / Uusi lugusid analüüsitakse ainult muusika vaikides
+        if is_open or not self.config.get('loudness_normalization', True):
+            self.analyzer.stop()
+        else:
+            self.analyzer.start()
+        if self.transcoder:
+            if is_open:
+                self.transcoder.stop()
+            else:
+                self.transcoder.start()
+
+    def on_diagnostics_stop(self, payload):
+        self.diagnostics.stop_capture()
+
+    def on_warm_up(self, payload):
+        logging.info("Music starts soon, preparing playback.")
+        for zone in self.zones.values():
+            zone.warm_up()
+
+    def on_batch_result(self, payload):
+        batch, path, future = payload
+        batch.on_result(path, future)
+
+    @property
+    def announcement_catch_up(self):
+        # Seconds an announcement may start after its time before it is dropped, at least 1
+        return max(self.config.get('announcement_catch_up', 60), 1)
+
+    def on_announcement(self, payload):
+        slot, announcement_file = payload
+        self.fired_announcements.add(slot)
+        logging.info(f"Announcement due: {announcement_file} at {format_slot(slot)}")
+        for zone in self.zones.values():
+            if zone.routes(announcement_file):
+                zone.queue_announcement(slot, announcement_file)
+
+    def on_day_change(self, payload):
+        # The log writer starts the new day's log file with this message
+        logging.info("Day changed.")
+        self.build_timeline()
+
+    def on_config_changed(self, payload):
+        if not self.config_reload_pending:
+            self.config_reload_pending = True
+            reload_time = self.clock.now() + timedelta(milliseconds=self.CONFIG_SETTLE_MS)
+            self.scheduler.schedule(reload_time, "config_reload")
+
+    def on_config_reload(self, payload):
+        self.config_reload_pending = False
+        self.reload_config_if_changed()
+
+    def on_config_poll(self, payload):
+        # Fallback when inotify is not available: one stat() per second
+        if self.config_watcher.changed():
+            self.reload_config_if_changed()
+        self.scheduler.schedule(self.clock.now() + timedelta(seconds=1), "config_poll")
+
+    def on_config_check(self, payload):
+        # Periodic full check, in case a change notification was missed (e.g. on network filesystems)
+        self.reload_config_if_changed()
+        self.schedule_config_check()
+
+    def reload_config_if_changed(self):
+        # Check if the configuration file content has changed / Kontrollige, kas konfiguratsioonifaili sisu on muutunud
+        try:
+            current_hash = get_file_hash(self.config_path)
+        except OSError as e:
+            logging.error(f"Could not read configuration file: {e}")
+            return
+        if current_hash == self.last_hash:
+            return
+        config = load_config(self.config_path)  # Load the updated configuration file / Laadige uuendatud konfiguratsioonifail
+        if config is None:
+            logging.error("Failed to load updated configuration. Keeping the current one.")
+            return
+        reload_started = time.monotonic()
+        changed = diff_config_sections(self.config, config)
+        if changed & {'schedule', 'announcements'}:
+            try:
+                schedule = CompiledSchedule.load_or_compile(config, current_hash, self.schedule_cache)
+            except (ValueError, KeyError) as e:
+                logging.error(f"Invalid schedule in updated configuration ({e}). Keeping the current one.")
+                return
+            self.schedule = schedule
+        self.config = config
+        self.last_hash = current_hash
+        self.enable_memory_logging = config.get('enable_memory_logging', False)
+        if 'logging' in changed:
+            configure_log_retention(config)
+        if 'diagnostics' in changed and config.get('diagnostics', False):
+            self.diagnostics.start_capture()
+        if 'loudness' in changed:
+            self.analyzer.workers = config.get('loudness_workers', 1)
+        if changed & {'loudness', 'transcode'}:
+            if self.transcoder:
+                self.transcoder.stop()
+            self.transcoder = self.make_transcoder(config)
+            if self.transcoder and self.closed:
+                self.transcoder.start()
+        if 'read_ahead' in changed:
+            if self.read_ahead:
+                self.read_ahead.close()
+            self.read_ahead = self.make_read_ahead_cache(config)
+
+        # Only the parts of the runtime whose settings changed are rebuilt / Uuesti ehitatakse ainult muutunud osad
+        rebuild_timeline = bool(changed & {'schedule', 'announcements'})
+        zone_configs = get_zone_configs(config)
+        self._playlists = {}
+        for name in list(self.zones):
+            if name not in zone_configs:
+                self.zones.pop(name).close()
+                changed.add(f"{name} (removed)")
+        for name, zone_config in zone_configs.items():
+            if name not in self.zones:
+                self.zones[name] = Zone(self, name, zone_config, shared_instance=len(zone_configs) > 1)
+                changed.add(f"{name} (added)")
+                rebuild_timeline = True
+                continue
+            zone_changed = self.zones[name].apply_config(zone_config)
+            changed |= {f"{name}.{section}" for section in zone_changed}
+            # New routing, or a new device that dropped the announcement cache
+            if zone_changed & {'device', 'routing'}:
+                rebuild_timeline = True
+        logging.info(f"Reloaded updated config file. Changed sections: {', '.join(sorted(changed)) or 'none'}.")
+
+        if rebuild_timeline:
+            # Rebuilding the timeline also starts or stops the music / Ajajoone ülesehitamine käivitab või peatab muusika
+            self.build_timeline()
+        else:
+            self.on_music_window(None)
+        for zone in self.zones.values():
+            zone.preload_upcoming()
+        self.metrics.observe('config_reload_seconds', time.monotonic() - reload_started)
+
+# Main function / Põhifunktsioon
+def main():
+    config = load_config(CONFIG_PATH)  # Load the configuration file / Laadige konfiguratsioonifail
+    if config is None:
+        logging.error("Failed to load configuration. Exiting.")
+        return
 
-                open_time_str, close_time_str = get_today_schedule(config)  # Get today's schedule / Saage tänane ajakava
-                open_time = datetime.strptime(open_time_str, "%H:%M").time()
-                close_time = datetime.strptime(close_time_str, "%H:%M").time()
-                time_before_opening = config['time_before_opening']
-                time_after_closing = config['time_after_closing']
-                config_check_interval = config['config_check_interval']
-                enable_memory_logging = config.get('enable_memory_logging', False) # Update memory logging setting
-                announcements = get_today_announcements(config)
-                start_time = (datetime.combine(datetime.now(), open_time) - timedelta(minutes=time_before_opening)).time()
-                end_time = (datetime.combine(datetime.now(), close_time) + timedelta(minutes=time_after_closing)).time()
-                last_hash = current_hash
-                logging.info(f"Reloaded updated config file: start time: {start_time}, end time: {end_time}")
-                logging.info(f"Today's announcements: {announcements}")
-                
-                # Check for audio device change
-                audio_device_from_config = config.get('audio_output_device')
-                new_audio_device = audio_device
-
-                if audio_device_from_config and audio_device_from_config.strip():
-                    new_audio_device = audio_device_from_config.strip()
-                else:
-                    # Auto detect again if not in config?
-                    # Original code didn't auto-detect again unless it was starting up, but logically we should if we want to support switching to auto-detect.
-                    # For safety, let's just stick to config value if present.
-                    # If empty in config, we might want to auto-detect.
-                    if 'audio_output_device' in config and not config['audio_output_device']:
-                         detected = detect_raspberry_pi_audio_device()
-                         if detected:
-                             new_audio_device = detected
-
-                # Update device in player
-                if radio_player.update_device(new_audio_device):
-                    audio_device = new_audio_device
-
-                # Reload audio files based on new config
-                music_folder_path_config = config.get('background_music_folder')
-                if music_folder_path_config and os.path.isdir(music_folder_path_config):
-                    audio_files = load_audio_files(music_folder_path_config)
-                elif os.path.isdir(default_music_folder):
-                    logging.info(f"No valid 'background_music_folder' in config, using default: {default_music_folder}")
-                    audio_files = load_audio_files(default_music_folder)
-                else:
-                    logging.warning("No background music folder specified in config and default 'bgmusic' folder not found after config reload. No background music will be played.")
-                    audio_files = [] # Ensure audio_files is empty
-
-                # Check if we should be playing music / Kontrollige, kas peaksime muusikat mängima
-                if audio_files:
-                    if is_time_between(start_time, end_time):
-                        state = radio_player.get_state()
-                        if state == vlc.State.NothingSpecial or state == vlc.State.Stopped or state == vlc.State.Ended:
-                             logging.info("Config file changed and within time window, starting/restarting playback.")
-                             file_index = 0
-                             radio_player.play_file(audio_files[file_index])
-                    else:
-                         radio_player.stop()
-                else: # No audio files after config reload
-                    radio_player.stop()
-
-        time.sleep(1)  # Check frequently for state changes / Kontrollige sageli olekumuutusi
+    station = RadioStation(config)
+    try:
+        asyncio.run(station.serve())
+    finally:
+        station.close()
 
 if __name__ == "__main__":
+    setup_logging()
     logging.info("Starting the script.")
+    restart_delay = MIN_RESTART_DELAY
     while True:
+        started = time.monotonic()
         try:
             main()  # Run the main function / Käivitage põhifunktsioon
         except Exception as e:
-            logging.error(f"Error: {e}")  # Log any errors / Logige kõik vead
-            time.sleep(60)  # Wait before restarting in case of error / Oodake enne uuesti käivitamist vea korral
+            logging.exception(f"Error: {e}")  # Log any errors with the traceback / Logige kõik vead koos jäljega
+        # A run that lasted a while was a one-off failure: restart quickly / Pikem töö tähendab ühekordset viga
+        if time.monotonic() - started > STABLE_RUN:
+            restart_delay = MIN_RESTART_DELAY
+        logging.info(f"Restarting in {restart_delay} s.")
+        time.sleep(restart_delay)  # Wait before restarting in case of error / Oodake enne uuesti käivitamist vea korral
+        restart_delay = min(restart_delay * 2, MAX_RESTART_DELAY)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Runs RATA against a simulated clock and a stub playback backend, so a whole
+week of a real config.toml can be checked in seconds on any Linux box, with
+no sound card and no VLC.
+
+Reports scheduling accuracy (announcement lateness, missed announcements,
+music window start/stop error), main loop wakeups, CPU time per simulated
+hour and memory growth. Exits with status 1 if an announcement was missed
+or the music started or stopped more than a second off schedule.
+
+Käivitab RATA simuleeritud kella ja asendusmängijaga, et nädala ajakava
+saaks mõne sekundiga läbi kontrollida.
+
+Usage / Kasutamine:
+    python3 simulate.py --config ~/Radio/config.toml --days 7
+"""
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import random
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta
+from functools import partial
+
+import play_audio
+
+class SimulatedClock:
+    """
+    Clock for the Scheduler that never sleeps: wait() jumps straight to the
+    next timer (a simulated track or announcement ending) or to the end of
+    the timeout, whichever comes first.
+    """
+    def __init__(self, start):
+        self.current = start
+        self._timers = []  # heap of (when, sequence, callback)
+        self._sequence = itertools.count()
+
+    def now(self):
+        return self.current
+
+    def call_at(self, when, callback):
+        heapq.heappush(self._timers, (when, next(self._sequence), callback))
+
+    def wait(self, condition, timeout):
+        deadline = self.current + timedelta(seconds=timeout)
+        if self._timers and self._timers[0][0] <= deadline:
+            when, _, callback = heapq.heappop(self._timers)
+            self.current = max(self.current, when)
+            callback()
+        else:
+            self.current = deadline
+
+class SimulatedPlayer:
+    """
+    Stand-in for play_audio.RadioPlayer with the same interface. Tracks and
+    announcements "play" for their duration on the simulated clock, and
+    every start and stop is recorded in self.log as (time, action, path).
+    """
+    def __init__(self, audio_device_name, event_callback=None, metrics=None, shared_instance=False, clock=None,
+                 track_seconds=210, announcement_seconds=20, seed=0):
+        self.audio_device_name = audio_device_name
+        self.event_callback = event_callback
+        self.metrics = metrics or play_audio.Metrics()
+        self.clock = clock
+        self.track_seconds = track_seconds
+        self.announcement_seconds = announcement_seconds
+        self.seed = seed
+        self.current_path = None
+        self.standby_path = None
+        self.fading_player = None  # crossfades finish at once here
+        self.crossfade_ms = 0
+        self.current_volume = 100
+        self.log = []
+        self._track_token = 0
+        self._announcement_token = 0
+        self._length_ms = 0
+        self._started = None
+
+    def track_length(self, file_path):
+        # Stable pseudo-random length per track, within 30% of track_seconds
+        rng = random.Random(zlib.crc32(file_path.encode()) ^ self.seed)
+        return self.track_seconds * rng.uniform(0.7, 1.3)
+
+    def _start(self, file_path, how, start_seconds=0):
+        self._track_token += 1
+        token = self._track_token
+        self._length_ms = int(self.track_length(file_path) * 1000)
+        length = max(self._length_ms / 1000 - start_seconds, 0)
+        self.current_path = file_path
+        now = self.clock.now()
+        self._started = now - timedelta(seconds=start_seconds)
+        self.log.append((now, how, file_path))
+        self.metrics.increment('tracks_played_total')
+        self.clock.call_at(now + timedelta(seconds=length), lambda: self._track_ended(token))
+        if self.crossfade_ms and length * 1000 > self.crossfade_ms:
+            self.clock.call_at(now + timedelta(seconds=length - self.crossfade_ms / 1000), lambda: self._crossfade_due(token))
+
+    def _track_ended(self, token):
+        if token == self._track_token:
+            self.event_callback("track_end")
+
+    def _crossfade_due(self, token):
+        if token == self._track_token and self.standby_path:
+            self.event_callback("track_crossfade")
+
+    def play_file(self, file_path, volume=None, start_seconds=0, gain=1.0):
+        if volume is not None:
+            self.current_volume = volume
+        self._start(file_path, "play", start_seconds)
+        return True
+
+    def preload_next(self, file_path, gain=1.0):
+        self.standby_path = file_path
+
+    def swap_to_standby(self):
+        file_path, self.standby_path = self.standby_path, None
+        if file_path:
+            self._start(file_path, "play")
+        return file_path
+
+    def begin_crossfade(self):
+        return self.swap_to_standby()
+
+    def crossfade_step(self, fraction):
+        pass
+
+    def end_crossfade(self):
+        pass
+
+    def stop(self):
+        if self.current_path:
+            self.log.append((self.clock.now(), "stop", self.current_path))
+        self._track_token += 1
+        self.current_path = None
+        self.standby_path = None
+
+    def set_volume(self, volume):
+        self.current_volume = volume
+
+    def current_length(self):
+        return self._length_ms
+
+    def current_position(self):
+        return (self.clock.now() - self._started).total_seconds() if self.current_path else 0
+
+    def preload_announcements(self, file_paths):
+        pass
+
+    def play_announcement(self, file_path):
+        self._announcement_token += 1
+        token = self._announcement_token
+        now = self.clock.now()
+        self.log.append((now, "announcement", file_path))
+        self.metrics.increment('announcements_played_total')
+        self.clock.call_at(now + timedelta(seconds=self.announcement_seconds), lambda: self._announcement_ended(token))
+        return self.announcement_seconds
+
+    def _announcement_ended(self, token):
+        if token == self._announcement_token:
+            self.event_callback("announcement_end")
+
+    def stop_announcement(self):
+        self._announcement_token += 1
+
+    def update_device(self, new_device_name):
+        return False
+
+    def reopen(self):
+        self.log.append((self.clock.now(), "reopen", None))
+
+    def release(self):
+        self.stop()
+        self.log.append((self.clock.now(), "release", None))
+
+    def diagnostics(self):
+        return {'device': self.audio_device_name, 'current_path': self.current_path, 'standby_path': self.standby_path}
+
+def next_monday(today):
+    return today + timedelta(days=(7 - today.weekday()) % 7 or 7)
+
+def evaluate(zone, start, end):
+    # Compare what the zone's stub player did with what the compiled schedule says
+    station, player = zone.station, zone.radio_player
+    report = {"announcements_expected": 0, "announcements_missed": [], "announcement_lateness": [],
+              "window_start_error": [], "window_stop_error": []}
+    announcement_starts = [(when, path) for when, action, path in player.log if action == "announcement"]
+    plays = [when for when, action, _ in player.log if action == "play"]
+    stops = [when for when, action, _ in player.log if action == "stop"]
+
+    catch_up = timedelta(seconds=station.announcement_catch_up)
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        for slot, announcement_file in station.schedule.announcements_for(day):
+            if not start <= slot < end or not zone.routes(announcement_file):
+                continue
+            report["announcements_expected"] += 1
+            path = play_audio.get_announcement_path(announcement_file)
+            # Played means started within announcement_catch_up, the same rule the runtime uses
+            late = [(when - slot).total_seconds() for when, played in announcement_starts
+                    if played == path and slot <= when <= slot + catch_up]
+            if late:
+                report["announcement_lateness"].append(min(late))
+            else:
+                report["announcements_missed"].append(f"{zone.name}: {slot:%Y-%m-%d %H:%M:%S} {announcement_file}")
+
+        window = station.schedule.window_for(day)
+        if window and zone.audio_files and start <= window[0] and window[1] < end:
+            first_play = next((when for when in plays if when >= window[0]), None)
+            first_stop = next((when for when in stops if when >= window[0]), None)
+            if first_play is not None:
+                report["window_start_error"].append((first_play - window[0]).total_seconds())
+            if first_stop is not None:
+                report["window_stop_error"].append((first_stop - window[1]).total_seconds())
+        day += timedelta(days=1)
+    return report
+
+def summarize(values):
+    if not values:
+        return "n/a"
+    return f"max {max(values):.3f} s, mean {sum(values) / len(values):.3f} s over {len(values)}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate RATA on a fast-forward clock and report scheduling accuracy.")
+    parser.add_argument("--config", default=play_audio.CONFIG_PATH, help="config.toml to simulate")
+    parser.add_argument("--days", type=float, default=7, help="simulated days (default 7)")
+    parser.add_argument("--start", help="first simulated day, YYYY-MM-DD (default: next Monday)")
+    parser.add_argument("--tracks", type=int, default=500, help="synthetic playlist size when the music folder is not available")
+    parser.add_argument("--track-seconds", type=float, default=210, help="mean simulated track length")
+    parser.add_argument("--announcement-seconds", type=float, default=20, help="simulated announcement length")
+    parser.add_argument("--seed", type=int, default=0, help="seed for simulated track lengths")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the runtime's log output")
+    args = parser.parse_args()
+    args.config = os.path.abspath(args.config)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(levelname)s:%(message)s')
+    play_audio.logger.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    config = play_audio.load_config(args.config)
+    if config is None:
+        sys.exit(f"Could not load {args.config}")
+    # Nothing is written next to the real installation / Päris paigalduse kõrvale midagi ei kirjutata
+    config['metrics_http_port'] = 0
+    config['loudness_normalization'] = False
+    config['transcode'] = False
+    config['read_ahead_tracks'] = 0
+    config['diagnostics'] = False
+    config['audio_output_device'] = "simulated"
+    for zone_config in config.get('zones', {}).values():
+        zone_config.pop('audio_output_device', None)
+
+    start_day = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else next_monday(datetime.now().date())
+    start = datetime.combine(start_day, datetime.min.time())
+    end = start + timedelta(days=args.days)
+
+    clock = SimulatedClock(start)
+    player_factory = partial(SimulatedPlayer, clock=clock, track_seconds=args.track_seconds,
+                             announcement_seconds=args.announcement_seconds, seed=args.seed)
+
+    tracemalloc.start()
+    rss_before = play_audio.get_current_rss_kb()
+    # The compiled schedule and metrics.prom go to a temporary folder, and the config file is not watched.
+    # metrics_interval is kept, so its wakeups count in the report.
+    cache_dir = tempfile.TemporaryDirectory(prefix="rata-simulate-")
+    config['metrics_file'] = os.path.join(cache_dir.name, "metrics.prom")
+    station = play_audio.RadioStation(config, clock=clock, player_factory=player_factory,
+                                      library=play_audio.LibraryIndex(":memory:"), config_path=args.config,
+                                      checkpoint_path=None, watch_config=False,
+                                      schedule_cache=os.path.join(cache_dir.name, "schedule_cache.json"))
+    for zone in station.zones.values():
+        if not zone.audio_files:
+            zone.use_playlist([f"/simulated/{zone.name}/track{number:05d}.mp3" for number in range(args.tracks)])
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    try:
+        station.run(until=end)
+    finally:
+        station.close()
+        cache_dir.cleanup()
+    cpu_seconds = time.process_time() - cpu_started
+    wall_seconds = time.perf_counter() - wall_started
+    traced_current, traced_peak = tracemalloc.get_traced_memory()
+    rss_after = play_audio.get_current_rss_kb()
+
+    zone_reports = {name: evaluate(zone, start, end) for name, zone in station.zones.items()}
+    report = {key: [value for zone_report in zone_reports.values() for value in zone_report[key]]
+              for key in ("announcements_missed", "announcement_lateness", "window_start_error", "window_stop_error")}
+    simulated_hours = args.days * 24
+    report.update({
+        "zones": list(zone_reports),
+        "announcements_expected": sum(zone_report["announcements_expected"] for zone_report in zone_reports.values()),
+        "simulated_start": start.isoformat(),
+        "simulated_days": args.days,
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_ms_per_simulated_hour": round(cpu_seconds * 1000 / simulated_hours, 3),
+        "wakeups": station.scheduler.wakeups,
+        "wakeups_per_simulated_day": round(station.scheduler.wakeups / args.days, 1),
+        "tracks_played": sum(1 for zone in station.zones.values() for _, action, _ in zone.radio_player.log if action == "play"),
+        "rss_growth_kb": rss_after - rss_before,
+        "traced_memory_kb": traced_current // 1024,
+        "traced_memory_peak_kb": traced_peak // 1024,
+    })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Simulated {args.days:g} days from {start:%Y-%m-%d} in {wall_seconds:.2f} s ({cpu_seconds:.2f} s CPU), zones: {', '.join(report['zones'])}")
+        print(f"Announcements: {report['announcements_expected']} expected, {len(report['announcements_missed'])} missed, lateness {summarize(report['announcement_lateness'])}")
+        for missed in report["announcements_missed"]:
+            print(f"  missed: {missed}")
+        print(f"Music window start error: {summarize(report['window_start_error'])}")
+        print(f"Music window stop error: {summarize(report['window_stop_error'])}")
+        print(f"Tracks played: {report['tracks_played']}")
+        print(f"Wakeups: {report['wakeups']} ({report['wakeups_per_simulated_day']} per simulated day)")
+        print(f"CPU per simulated hour: {report['cpu_ms_per_simulated_hour']} ms")
+        print(f"Memory: RSS growth {report['rss_growth_kb']} KB, traced {report['traced_memory_kb']} KB (peak {report['traced_memory_peak_kb']} KB)")
+
+    errors = report["window_start_error"] + report["window_stop_error"]
+    if report["announcements_missed"] or any(abs(error) > 1 for error in errors):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
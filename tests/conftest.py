@@ -0,0 +1,63 @@
+import os
+import sys
+from functools import partial
+
+import pytest
+import toml
+
+# The scripts live in the repository root / Skriptid asuvad hoidla juurkaustas
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def config():
+    # A small valid config.toml as loaded; each test gets its own copy
+    return {
+        'default_open_time': "09:00",
+        'default_close_time': "21:00",
+        'time_before_opening': 15,
+        'time_after_closing': 15,
+        'config_check_interval': 120,
+        'weekly_schedule': {'saturday': {'open_time': "10:00", 'close_time': "18:00"},
+                            'sunday': {'open_time': "22:00", 'close_time': "02:00"}},
+        'default_announcements': {"12:00": "lunch.mp3"},
+        'announcements': {'friday': {"20:30:15": "closing.mp3", "10:00": "open.mp3"}},
+        'date_exceptions': {"2027-01-01": {'closed': True},
+                            "2027-12-24": {'close_time': "15:00", 'announcements': {"14:45": "xmas.mp3"}}},
+        'dayparts': {'morning': {'start': "06:00", 'end': "11:00", 'folders': ["Calm"]}},
+    }
+
+
+@pytest.fixture
+def make_station(tmp_path):
+    """
+    Builds a RadioStation on the simulator's clock and stub player, with a
+    music folder of empty files under tmp_path. Nothing is written outside
+    tmp_path.
+    """
+    import play_audio
+    import simulate
+
+    stations = []
+
+    def make_station(config, start, tracks=("Calm/a.mp3", "Calm/b.mp3", "Fast/c.mp3", "Fast/d.mp3"), checkpoint_path=None):
+        music = tmp_path / "music"
+        for track in tracks:
+            (music / track).parent.mkdir(parents=True, exist_ok=True)
+            (music / track).touch()
+        config = dict(config, background_music_folder=str(music), audio_output_device="simulated",
+                      metrics_file=str(tmp_path / "metrics.prom"), metrics_http_port=0, loudness_normalization=False,
+                      transcode=False, diagnostics=False)
+        config_path = tmp_path / "config.toml"
+        config_path.write_text(toml.dumps(config))
+        clock = simulate.SimulatedClock(start)
+        station = play_audio.RadioStation(config, clock=clock, player_factory=partial(simulate.SimulatedPlayer, clock=clock),
+                                          library=play_audio.LibraryIndex(":memory:"), config_path=str(config_path),
+                                          checkpoint_path=checkpoint_path, watch_config=False,
+                                          schedule_cache=str(tmp_path / "schedule_cache.json"))
+        stations.append(station)
+        return station
+
+    yield make_station
+    for station in stations:
+        station.close()
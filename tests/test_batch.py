@@ -0,0 +1,20 @@
+import os
+import queue
+import threading
+
+import pytest
+
+import play_audio
+
+
+def test_batch_worker_reports_its_pid_and_refuses_tasks_after_stop(monkeypatch):
+    monkeypatch.setattr(os, "nice", lambda increment: 0)
+    monkeypatch.setattr(os, "setpgrp", lambda: None)
+    monkeypatch.setattr(play_audio, "batch_stopping", None)
+    pids, stopping = queue.SimpleQueue(), threading.Event()
+    play_audio.init_batch_worker(pids, stopping)
+    assert pids.get_nowait() == os.getpid()
+    assert play_audio.run_batch_task(max, 1, 2) == 2
+    stopping.set()
+    with pytest.raises(RuntimeError):
+        play_audio.run_batch_task(max, 1, 2)
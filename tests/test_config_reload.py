@@ -0,0 +1,10 @@
+from play_audio import ZONE_SECTIONS, diff_config_sections
+
+
+def test_diff_config_sections(config):
+    new = dict(config, default_close_time="22:00", duck_volume=30)
+    assert diff_config_sections(config, dict(config)) == set()
+    assert diff_config_sections(config, new) == {'schedule'}
+    assert diff_config_sections(config, new, ZONE_SECTIONS) == {'volume'}
+    del new['dayparts']
+    assert diff_config_sections(config, new, ZONE_SECTIONS) == {'volume', 'playlist'}
@@ -0,0 +1,58 @@
+import pytest
+
+import fleet_check
+
+
+def test_check_config_accepts_a_valid_config(config):
+    errors, warnings, files = fleet_check.check_config(config)
+    assert errors == []
+    assert warnings == []
+    assert files == {"lunch.mp3", "closing.mp3", "open.mp3", "xmas.mp3"}
+
+
+def test_check_config_reports_missing_keys_and_bad_values(config):
+    del config['config_check_interval']
+    config['time_before_opening'] = -5
+    config['weekly_schedule']['funday'] = {}
+    errors, warnings, _ = fleet_check.check_config(config)
+    assert "config_check_interval: missing" in errors
+    assert any(error.startswith("time_before_opening:") for error in errors)
+    assert warnings == ["weekly_schedule.funday: not a day name, ignored"]
+
+
+@pytest.mark.parametrize("value", ["25:00", "09:00:00", "9", 900, None])
+def test_check_config_rejects_times_the_runtime_cannot_parse(config, value):
+    errors, _, _ = fleet_check.check_config(dict(config, default_open_time=value))
+    assert len(errors) == 1 and errors[0].startswith("default_open_time:")
+
+
+@pytest.mark.parametrize("value", ["9:00", "9:3"])
+def test_check_config_warns_about_times_without_two_digits(config, value):
+    errors, warnings, _ = fleet_check.check_config(dict(config, default_open_time=value))
+    assert errors == []
+    assert len(warnings) == 1 and warnings[0].startswith("default_open_time:")
+
+
+def test_check_config_warns_about_announcement_times_without_two_digits(config):
+    errors, warnings, _ = fleet_check.check_config(dict(config, default_announcements={"9:30:05": "a.mp3", "25:00": "b.mp3"}))
+    assert errors == ['default_announcements."25:00": \'25:00\' is not a time of day, expected "HH:MM" or "HH:MM:SS"']
+    assert warnings == ['default_announcements."9:30:05": \'9:30:05\' works, but is not written as "HH:MM" or "HH:MM:SS"']
+
+
+@pytest.mark.parametrize("key, value", [
+    ('weekly_schedule', {'monday': "09:00"}),
+    ('date_exceptions', {"2027-01-01": "closed"}),
+    ('announcements', ["monday"]),
+    ('dayparts', {'morning': 3}),
+    ('zones', {'terrace': "hw:2,0"}),
+    ('folder_weights', {'Jazz': "2"}),
+])
+def test_check_config_reports_malformed_tables(config, key, value):
+    errors, _, _ = fleet_check.check_config(dict(config, **{key: value}))
+    assert len(errors) == 1 and errors[0].startswith(key)
+
+
+def test_check_store_reports_a_broken_store_without_raising(tmp_path):
+    (tmp_path / "broken.toml").write_text('default_open_time = "09:00"\n[weekly_schedule]\nmonday = "09:00"\n')
+    result = fleet_check.check_store("broken", str(tmp_path / "broken.toml"), str(tmp_path), 2027)
+    assert result['errors'] and result['summary'] is None
@@ -0,0 +1,86 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from play_audio import LibraryIndex, ReadAheadCache
+
+
+@pytest.fixture
+def library():
+    library = LibraryIndex(":memory:")
+    yield library
+    library.close()
+
+
+def make_tracks(root, *names):
+    for name in names:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * 100)
+
+
+def bump_mtime(path):
+    # Directory mtimes may not change within the file system's time resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_sync_finds_tracks_and_skips_other_files(tmp_path, library):
+    make_tracks(str(tmp_path), "b.mp3", "a.FLAC", "sub/c.ogg", "cover.jpg")
+    assert library.sync(str(tmp_path)) == [str(tmp_path / "a.FLAC"), str(tmp_path / "b.mp3"), str(tmp_path / "sub" / "c.ogg")]
+    assert library.sync(str(tmp_path), recursive=False) == [str(tmp_path / "a.FLAC"), str(tmp_path / "b.mp3")]
+
+
+def test_sync_notices_added_and_removed_tracks(tmp_path, library):
+    make_tracks(str(tmp_path), "a.mp3", "sub/b.mp3")
+    library.sync(str(tmp_path))
+    os.remove(tmp_path / "a.mp3")
+    make_tracks(str(tmp_path), "sub/c.mp3")
+    bump_mtime(tmp_path)
+    bump_mtime(tmp_path / "sub")
+    assert library.sync(str(tmp_path)) == [str(tmp_path / "sub" / "b.mp3"), str(tmp_path / "sub" / "c.mp3")]
+
+
+def test_nested_roots_share_one_index(tmp_path, library):
+    music, cafe = str(tmp_path / "music"), str(tmp_path / "music" / "cafe")
+    make_tracks(music, "a.mp3", "cafe/b.mp3", "cafe/deep/c.mp3")
+    assert len(library.sync(music)) == 3
+    assert library.sync(cafe) == [os.path.join(cafe, "b.mp3"), os.path.join(cafe, "deep", "c.mp3")]
+    assert library.sync(cafe, recursive=False) == [os.path.join(cafe, "b.mp3")]
+
+    # A track added to the inner folder is found from both roots
+    make_tracks(music, "cafe/new.mp3")
+    bump_mtime(cafe)
+    assert os.path.join(cafe, "new.mp3") in library.sync(music)
+    assert library.sync(cafe) == [os.path.join(cafe, name) for name in ("b.mp3", "deep/c.mp3", "new.mp3")]
+    assert len(library.tracks_missing('loudness')) == 4
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_read_ahead_cache_serves_copies_while_the_share_is_gone(tmp_path, library):
+    share = str(tmp_path / "share")
+    make_tracks(share, "a.mp3", "b.mp3", "sub/c.mp3")
+    tracks = library.sync(share, keep_unreachable=True)
+    cache = ReadAheadCache(library, str(tmp_path / "cache"), 10)
+    try:
+        cache.prefetch(tracks)
+        wait_for(lambda: all(cache.resolve(path) for path in tracks))
+
+        # The share is unmounted: the mount point is empty
+        shutil.rmtree(share)
+        os.makedirs(share)
+        assert library.sync(share, keep_unreachable=True) == tracks
+        assert all(cache.resolve(path) for path in tracks)
+        # Without read-ahead the index follows the folder
+        assert library.sync(share) == []
+    finally:
+        cache.close()
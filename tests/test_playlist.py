@@ -0,0 +1,109 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from play_audio import Playlist, TrackPool, WeightTree, match_folder
+
+MUSIC = "/home/pi/Radio/bgmusic"
+
+
+class FixedClock:
+    def __init__(self, now):
+        self.time = now
+
+    def now(self):
+        return self.time
+
+
+@pytest.fixture
+def music(tmp_path):
+    # The playlist matches folders relative to an existing music folder
+    return str(tmp_path)
+
+
+def tracks(music, folder, count):
+    return [f"{music}/{folder}/Artist {folder} {i} - Song.mp3" for i in range(count)]
+
+
+def test_match_folder_prefers_the_most_specific_folder():
+    folders = {'Jazz': 2, 'Jazz/Vocal': 3}
+    assert match_folder(f"{MUSIC}/Jazz/Vocal/a.mp3", folders, MUSIC) == 'Jazz/Vocal'
+    assert match_folder(f"{MUSIC}/Jazz/b.mp3", folders, MUSIC) == 'Jazz'
+    assert match_folder(f"{MUSIC}/Rock/c.mp3", folders, MUSIC) is None
+
+
+def test_match_folder_is_anchored_at_the_music_folder():
+    music = "/home/pi/Jazz/Radio/bgmusic"
+    assert match_folder(f"{music}/Rock/b.mp3", {'Jazz': 2}, music) is None
+    assert match_folder(f"{music}/Rock/Jazz/b.mp3", {'Jazz': 2}, music) is None
+
+
+def test_weight_tree_find_and_set():
+    tree = WeightTree([1, 0, 2, 1])
+    assert tree.total == 4
+    assert [tree.find(value) for value in (0, 0.5, 1, 2.5, 3)] == [0, 0, 2, 2, 3]
+    tree.set(2, 0)
+    assert tree.total == 2
+    assert tree.find(1) == 3
+
+
+def test_track_pool_does_not_repeat_until_half_has_played():
+    pool = TrackPool(range(10), [1] * 10, shuffle=True, no_repeat=5)
+    rng = random.Random(1)
+    picks = [pool.pick_shuffled(rng, lambda index: False) for _ in range(200)]
+    for i in range(len(picks) - 5):
+        assert picks[i] not in picks[i + 1:i + 6]
+
+
+def test_sequential_playlist_continues_from_current(music):
+    files = tracks(music, "Pop", 4)
+    playlist = Playlist(files, {}, FixedClock(datetime(2027, 1, 4, 12)), current=2)
+    assert [playlist.advance() for _ in range(3)] == [3, 0, 1]
+
+
+def test_shuffle_follows_folder_weights_and_leaves_out_weight_zero(music):
+    files = tracks(music, "Jazz", 20) + tracks(music, "Rock", 20) + tracks(music, "Xmas", 20)
+    config = {'playlist_order': 'shuffle', 'shuffle_seed': 7, 'background_music_folder': music,
+              'folder_weights': {'Jazz': 3, 'Xmas': 0}}
+    playlist = Playlist(files, config, FixedClock(datetime(2027, 1, 4, 12)))
+    counts = Counter(files[playlist.advance()].split("/")[-2] for _ in range(4000))
+    assert counts['Xmas'] == 0
+    # Weight 3 against 1, evened out somewhat by not repeating half of the pool
+    assert counts['Jazz'] > 1.5 * counts['Rock']
+
+
+def test_all_weights_zero_falls_back_to_equal_weights(music):
+    files = tracks(music, "Jazz", 3) + tracks(music, "Rock", 3)
+    config = {'playlist_order': 'shuffle', 'background_music_folder': music, 'folder_weights': {'Jazz': 0, 'Rock': 0}}
+    playlist = Playlist(files, config, FixedClock(datetime(2027, 1, 4, 12)))
+    assert {playlist.advance() for _ in range(60)} == set(range(6))
+
+
+def test_empty_playlist_has_no_next_track():
+    playlist = Playlist([], {}, FixedClock(datetime(2027, 1, 4, 12)))
+    assert playlist.peek() is None
+    assert playlist.advance() is None
+
+
+def test_dayparts_limit_the_folders_and_bad_dayparts_are_skipped(music):
+    files = tracks(music, "Calm", 5) + tracks(music, "Fast", 5)
+    clock = FixedClock(datetime(2027, 1, 4, 8))
+    config = {'playlist_order': 'shuffle', 'background_music_folder': music,
+              'dayparts': {'morning': {'start': "06:00", 'end': "11:00", 'folders': ["Calm"]},
+                           'broken': {'start': "25:00", 'end': "26:00", 'folders': ["Fast"]},
+                           'no_end': {'start': "11:00", 'folders': ["Fast"]}}}
+    playlist = Playlist(files, config, clock)
+    assert len(playlist.dayparts) == 1
+    assert all(playlist.advance() < 5 for _ in range(20))
+    clock.time = datetime(2027, 1, 4, 12)
+    assert {playlist.advance() for _ in range(200)} == set(range(10))
+
+
+def test_artist_separation_keeps_artists_apart():
+    files = [f"{MUSIC}/Pop/Artist {i % 4} - Song {i}.mp3" for i in range(40)]
+    config = {'playlist_order': 'shuffle', 'shuffle_seed': 3, 'artist_separation': 2}
+    playlist = Playlist(files, config, FixedClock(datetime(2027, 1, 4, 12)))
+    artists = [files[playlist.advance()].split("/")[-1].split(" - ")[0] for _ in range(100)]
+    assert all(len(set(artists[i:i + 3])) == 3 for i in range(len(artists) - 2))
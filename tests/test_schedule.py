@@ -0,0 +1,62 @@
+import os
+from datetime import date, datetime
+
+import pytest
+import toml
+
+import play_audio
+from play_audio import CompiledSchedule, parse_seconds
+
+
+def test_window_includes_time_before_opening_and_after_closing(config):
+    schedule = CompiledSchedule.compile(config)
+    assert schedule.window_for(date(2027, 1, 4)) == (datetime(2027, 1, 4, 8, 45), datetime(2027, 1, 4, 21, 15))
+    assert schedule.window_for(date(2027, 1, 9)) == (datetime(2027, 1, 9, 9, 45), datetime(2027, 1, 9, 18, 15))
+
+
+def test_window_spanning_midnight_ends_next_day(config):
+    schedule = CompiledSchedule.compile(config)
+    assert schedule.window_for(date(2027, 1, 10)) == (datetime(2027, 1, 10, 21, 45), datetime(2027, 1, 11, 2, 15))
+    assert schedule.is_open(datetime(2027, 1, 11, 1, 0))
+    assert not schedule.is_open(datetime(2027, 1, 11, 3, 0))
+
+
+def test_date_exceptions_take_precedence(config):
+    schedule = CompiledSchedule.compile(config)
+    assert schedule.window_for(date(2027, 1, 1)) is None
+    assert schedule.announcements_for(date(2027, 1, 1)) == []
+    assert not schedule.is_open(datetime(2027, 1, 1, 12, 0))
+    assert schedule.window_for(date(2027, 12, 24)) == (datetime(2027, 12, 24, 8, 45), datetime(2027, 12, 24, 15, 15))
+    assert schedule.announcements_for(date(2027, 12, 24)) == [(datetime(2027, 12, 24, 14, 45), "xmas.mp3")]
+
+
+def test_load_or_compile_uses_cache_only_for_the_same_hash(tmp_path, config):
+    cache_path = str(tmp_path / "schedule_cache.json")
+    compiled = CompiledSchedule.load_or_compile(config, "hash-1", cache_path)
+    cached = CompiledSchedule.load_or_compile({}, "hash-1", cache_path)  # would not compile
+    assert cached.window_for(date(2027, 1, 9)) == compiled.window_for(date(2027, 1, 9))
+    assert cached.announcements_for(date(2027, 12, 24)) == compiled.announcements_for(date(2027, 12, 24))
+    changed = CompiledSchedule.load_or_compile(dict(config, default_open_time="07:00"), "hash-2", cache_path)
+    assert changed.window_for(date(2027, 1, 4))[0] == datetime(2027, 1, 4, 6, 45)
+
+
+def test_shipped_config_compiles():
+    with open(os.path.join(os.path.dirname(play_audio.__file__), "config.toml"), encoding="utf-8") as f:
+        config = toml.load(f)
+    schedule = CompiledSchedule.compile(config)
+    assert any(schedule.window_for(date(2027, 1, day)) for day in range(4, 11))
+
+
+def test_announcements_are_per_day_in_time_order_to_the_second(config):
+    schedule = CompiledSchedule.compile(config)
+    assert schedule.announcements_for(date(2027, 1, 8)) == [(datetime(2027, 1, 8, 10, 0), "open.mp3"),
+                                                             (datetime(2027, 1, 8, 20, 30, 15), "closing.mp3")]
+    assert schedule.announcements_for(date(2027, 1, 7)) == [(datetime(2027, 1, 7, 12, 0), "lunch.mp3")]
+
+
+def test_parse_seconds():
+    assert parse_seconds("00:00") == 0
+    assert parse_seconds("09:30") == 9 * 3600 + 30 * 60
+    assert parse_seconds("23:59:59") == 86399
+    with pytest.raises(ValueError):
+        parse_seconds("24:00")
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from play_audio import Scheduler
+from simulate import SimulatedClock
+
+START = datetime(2027, 1, 4, 12, 0)
+
+
+def test_events_come_in_time_order_and_ties_in_scheduling_order():
+    clock = SimulatedClock(START)
+    scheduler = Scheduler(clock=clock)
+    scheduler.schedule(START + timedelta(seconds=30), "b")
+    scheduler.schedule(START + timedelta(seconds=10), "a", 1)
+    scheduler.schedule(START + timedelta(seconds=30), "c")
+    assert scheduler.upcoming(2) == [(START + timedelta(seconds=10), "a"), (START + timedelta(seconds=30), "b")]
+    assert scheduler.next_event() == ("a", 1)
+    assert clock.now() == START + timedelta(seconds=10)
+    assert [scheduler.next_event()[0] for _ in range(2)] == ["b", "c"]
+    assert clock.now() == START + timedelta(seconds=30)
+
+
+def test_posted_events_come_before_due_timed_events():
+    scheduler = Scheduler(clock=SimulatedClock(START))
+    scheduler.schedule(START, "timed")
+    scheduler.post("posted")
+    assert [scheduler.next_event()[0] for _ in range(2)] == ["posted", "timed"]
+
+
+def test_cancel_removes_every_event_of_the_kinds():
+    scheduler = Scheduler(clock=SimulatedClock(START))
+    for minutes, kind in enumerate(["checkpoint", "announcement", "checkpoint", "metrics_export"]):
+        scheduler.schedule(START + timedelta(minutes=minutes), kind)
+    scheduler.cancel("checkpoint", "metrics_export")
+    assert scheduler.upcoming(10) == [(START + timedelta(minutes=1), "announcement")]
+
+
+def test_long_sleeps_are_cut_into_max_sleep_wakeups():
+    clock = SimulatedClock(START)
+    scheduler = Scheduler(clock=clock)
+    scheduler.schedule(START + timedelta(seconds=Scheduler.MAX_SLEEP * 3), "late")
+    assert scheduler.next_event()[0] == "late"
+    assert scheduler.wakeups == 3
+    assert scheduler.metrics.totals()['wakeups_total'] == 3
+
+
+def test_a_post_from_another_thread_wakes_the_async_loop():
+    scheduler = Scheduler()
+    scheduler.schedule(datetime.now() + timedelta(hours=1), "later")
+
+    async def wait_for_post():
+        threading.Timer(0.05, scheduler.post, ("track_end", "main")).start()
+        return await asyncio.wait_for(scheduler.next_event_async(), 5)
+
+    assert asyncio.run(wait_for_post()) == ("track_end", "main")
@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import play_audio
+
+
+def played_announcements(station):
+    return [(when.strftime("%H:%M:%S"), os.path.basename(path)) for when, action, path in station.zones['main'].radio_player.log
+            if action == "announcement"]
+
+
+def test_metrics_are_exported_while_open_and_once_at_closing(config, make_station, monkeypatch):
+    station = make_station(dict(config, metrics_interval=600), datetime(2027, 1, 4, 20, 0))
+    exports = []
+    monkeypatch.setattr(play_audio.Metrics, "write_file", lambda self, path=None: exports.append(station.clock.now()))
+    station.run(until=datetime(2027, 1, 5, 10, 0))
+    # The window is 08:45-21:15: nothing is written between closing and opening
+    assert [t.strftime("%H:%M") for t in exports] == [
+        "20:00", "20:10", "20:20", "20:30", "20:40", "20:50", "21:00", "21:10", "21:15",
+        "08:45", "08:55", "09:05", "09:15", "09:25", "09:35", "09:45", "09:55"]
+
+
+def test_metrics_file_is_off_by_default(config, make_station, tmp_path):
+    station = make_station(config, datetime(2027, 1, 4, 12, 0))
+    station.run(until=datetime(2027, 1, 4, 13, 0))
+    assert not (tmp_path / "metrics.prom").exists()
+
+
+def test_announcements_due_together_are_queued_one_after_another(config, make_station):
+    config = dict(config, default_announcements={"12:00": "lunch.mp3", "12:00:10": "offer.mp3"})
+    station = make_station(config, datetime(2027, 1, 4, 11, 0))
+    station.run(until=datetime(2027, 1, 4, 12, 5))
+    # The simulated announcements last 20 s, so the second one waits behind the first
+    assert played_announcements(station) == [("12:00:00", "lunch.mp3"), ("12:00:20", "offer.mp3")]
+    assert station.zones['main'].radio_player.current_volume == station.zones['main'].volume
+
+
+def test_an_announcement_queued_longer_than_catch_up_is_dropped(config, make_station):
+    config = dict(config, announcement_catch_up=5, default_announcements={"12:00": "lunch.mp3", "12:00:10": "offer.mp3"})
+    station = make_station(config, datetime(2027, 1, 4, 11, 0))
+    station.run(until=datetime(2027, 1, 4, 12, 5))
+    assert played_announcements(station) == [("12:00:00", "lunch.mp3")]
+    assert station.metrics.totals()['announcements_dropped_total'] == 1
+
+
+@pytest.mark.parametrize("start, played", [
+    (datetime(2027, 1, 4, 12, 0, 30), [("12:00:30", "lunch.mp3")]),  # within the default 60 s
+    (datetime(2027, 1, 4, 12, 2), []),
+])
+def test_an_announcement_missed_before_the_start_is_caught_up(config, make_station, start, played):
+    station = make_station(config, start)
+    station.run(until=datetime(2027, 1, 4, 12, 10))
+    assert played_announcements(station) == played
+
+
+def write_checkpoint(path, saved, track, position=100.0, playing=True, fired=()):
+    path.write_text(json.dumps({'saved': saved.isoformat(), 'fired_announcements': [slot.isoformat() for slot in fired],
+                                'zones': {'main': {'track': track, 'position': position, 'playing': playing}}}))
+    return str(path)
+
+
+def test_restore_checkpoint_resumes_the_track_where_it_kept_playing(config, make_station, tmp_path):
+    track = str(tmp_path / "music" / "Fast" / "c.mp3")
+    checkpoint = write_checkpoint(tmp_path / "checkpoint.json", datetime(2027, 1, 4, 11, 58), track)
+    station = make_station(config, datetime(2027, 1, 4, 12, 0, 30), checkpoint_path=checkpoint)
+    zone = station.zones['main']
+    assert zone.audio_files[zone.file_index] == track
+    assert zone.resume_seconds == 100 + 150
+
+
+def test_restore_checkpoint_keeps_todays_fired_announcements(config, make_station, tmp_path):
+    fired = [datetime(2027, 1, 3, 12, 0), datetime(2027, 1, 4, 12, 0)]
+    checkpoint = write_checkpoint(tmp_path / "checkpoint.json", datetime(2027, 1, 4, 12, 0, 20), None, fired=fired)
+    station = make_station(config, datetime(2027, 1, 4, 12, 0, 30), checkpoint_path=checkpoint)
+    assert station.fired_announcements == {datetime(2027, 1, 4, 12, 0)}
+    station.run(until=datetime(2027, 1, 4, 12, 10))
+    assert played_announcements(station) == []  # already played before the restart
+
+
+def test_an_old_checkpoint_resumes_the_track_from_its_start(config, make_station, tmp_path):
+    track = str(tmp_path / "music" / "Fast" / "c.mp3")
+    checkpoint = write_checkpoint(tmp_path / "checkpoint.json", datetime(2027, 1, 4, 9, 0), track)
+    station = make_station(config, datetime(2027, 1, 4, 12, 0), checkpoint_path=checkpoint)
+    zone = station.zones['main']
+    assert zone.audio_files[zone.file_index] == track
+    assert zone.resume_seconds == 0
+
+
+@pytest.mark.parametrize("content", ["", "{", json.dumps({'saved': "yesterday", 'zones': {}, 'fired_announcements': []}),
+                                     json.dumps({'zones': {}})])
+def test_a_broken_checkpoint_starts_fresh(config, make_station, tmp_path, content):
+    (tmp_path / "checkpoint.json").write_text(content)
+    station = make_station(config, datetime(2027, 1, 4, 12, 0), checkpoint_path=str(tmp_path / "checkpoint.json"))
+    assert station.fired_announcements == set()
+    assert station.zones['main'].resume_seconds == 0
+
+
+def test_a_saved_checkpoint_is_restored_by_the_next_run(config, make_station, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    station = make_station(config, datetime(2027, 1, 4, 11, 59), checkpoint_path=checkpoint)
+    station.run(until=datetime(2027, 1, 4, 12, 1))
+    zone = station.zones['main']
+    track, position = zone.audio_files[zone.file_index], zone.radio_player.current_position()
+    station.save_checkpoint()
+    station.close()
+
+    restarted = make_station(config, datetime(2027, 1, 4, 12, 1, 10), checkpoint_path=checkpoint)
+    zone = restarted.zones['main']
+    assert zone.audio_files[zone.file_index] == track
+    assert zone.resume_seconds == position + 10
+    assert restarted.fired_announcements == {datetime(2027, 1, 4, 12, 0)}
@@ -0,0 +1,18 @@
+import struct
+
+from play_audio import is_complete_wav
+
+
+def write_wav(path, data=b"\0" * 400, declared=None):
+    size = 36 + len(data) if declared is None else declared
+    path.write_bytes(b"RIFF" + struct.pack("<I", size) + b"WAVEfmt " + struct.pack("<IHHIIHH", 16, 1, 2, 48000, 192000, 4, 16)
+                     + b"data" + struct.pack("<I", len(data)) + data)
+    return str(path)
+
+
+def test_is_complete_wav(tmp_path):
+    assert is_complete_wav(write_wav(tmp_path / "ok.wav"))
+    assert not is_complete_wav(write_wav(tmp_path / "cut.wav", declared=10000))
+    (tmp_path / "other.wav").write_bytes(b"ID3" + b"\0" * 100)
+    assert not is_complete_wav(str(tmp_path / "other.wav"))
+    assert not is_complete_wav(str(tmp_path / "missing.wav"))
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+
+def played_tracks(zone):
+    return [path.rsplit("/", 2)[-2] + "/" + path.rsplit("/", 1)[-1] for _, action, path in zone.radio_player.log
+            if action in ("play", "swap")]
+
+
+def test_first_track_of_a_fresh_start_comes_from_the_playlist(config, make_station):
+    # Monday 05:00, before the 08:45 window; the morning daypart plays only Fast
+    config = dict(config, playlist_order="shuffle", dayparts={'morning': {'start': "06:00", 'end': "11:00", 'folders': ["Fast"]}})
+    for seed in range(5):
+        station = make_station(dict(config, shuffle_seed=seed), datetime(2027, 1, 4, 5, 0))
+        station.run(until=datetime(2027, 1, 4, 9, 0))
+        assert played_tracks(station.zones['main'])[0].startswith("Fast/")
+
+
+def test_each_opening_starts_with_a_new_pick(config, make_station):
+    config = dict(config, playlist_order="shuffle", shuffle_seed=1, dayparts={})
+    station = make_station(config, datetime(2027, 1, 4, 20, 0))
+    station.run(until=datetime(2027, 1, 5, 8, 50))
+    zone = station.zones['main']
+    log = [(when, path) for when, action, path in zone.radio_player.log if action in ("play", "swap")]
+    last_evening = [path for when, path in log if when < datetime(2027, 1, 5)][-1]
+    first_morning = [path for when, path in log if when > datetime(2027, 1, 5)][0]
+    assert first_morning != last_evening